@@ -1,6 +1,6 @@
 import os
 import aiohttp
-from fastapi import FastAPI, Depends, HTTPException
+from fastapi import FastAPI, Depends, HTTPException, Request
 from sqlmodel import select, Session
 from fastapi.middleware.cors import CORSMiddleware
 
@@ -10,11 +10,35 @@ from models import *
 app = FastAPI()
 
 PARSER_URL = os.getenv("PARSER_URL")
+PARSER_HTTP_LIMIT = int(os.getenv("PARSER_HTTP_LIMIT", "100"))
+PARSER_HTTP_KEEPALIVE_TIMEOUT = float(os.getenv("PARSER_HTTP_KEEPALIVE_TIMEOUT", "30"))
+
+
+def forwarded_headers(request: Request) -> dict:
+    client = request.headers.get("X-Client-Id")
+    return {"X-Client-Id": client} if client else {}
+
+
+def retry_headers(resp) -> dict:
+    # Pass the parser's backpressure hint through to the caller.
+    retry_after = resp.headers.get("Retry-After")
+    return {"Retry-After": retry_after} if retry_after else None
 
 
 @app.on_event("startup")
-def on_startup():
+async def on_startup():
     init_db()
+    connector = aiohttp.TCPConnector(
+        limit=PARSER_HTTP_LIMIT,
+        limit_per_host=PARSER_HTTP_LIMIT,
+        keepalive_timeout=PARSER_HTTP_KEEPALIVE_TIMEOUT,
+    )
+    app.state.http_session = aiohttp.ClientSession(connector=connector)
+
+
+@app.on_event("shutdown")
+async def on_shutdown():
+    await app.state.http_session.close()
 
 
 @app.get("/participants", response_model=List[ParticipantRead])
@@ -325,29 +349,94 @@ def delete_evaluation(
 
 
 @app.post("/parse")
-async def parse_endpoint(url: str):
-    async with aiohttp.ClientSession() as session:
-        try:
-            async with session.post(f"{PARSER_URL}/parse?url={url}") as resp:
-                if resp.status != 200:
-                    text = await resp.text()
-                    raise HTTPException(status_code=resp.status, detail=f"Parser error: {text}")
-                return {"message": "Parser completed"}
-        except aiohttp.ClientError as e:
-            raise HTTPException(status_code=500, detail=f"Parser request failed: {str(e)}")
+async def parse_endpoint(request: Request, url: str):
+    session = app.state.http_session
+    try:
+        async with session.post(
+            f"{PARSER_URL}/parse", params={"url": url}, headers=forwarded_headers(request)
+        ) as resp:
+            if resp.status != 200:
+                text = await resp.text()
+                raise HTTPException(status_code=resp.status, detail=f"Parser error: {text}")
+            return {**await resp.json(), "message": "Parser completed"}
+    except aiohttp.ClientError as e:
+        raise HTTPException(status_code=500, detail=f"Parser request failed: {str(e)}")
 
 
 @app.post("/parse_celery")
-async def parse_endpoint(url: str):
-    async with aiohttp.ClientSession() as session:
-        try:
-            async with session.post(f"{PARSER_URL}/parse_celery?url={url}") as resp:
-                if resp.status != 200:
-                    text = await resp.text()
-                    raise HTTPException(status_code=resp.status, detail=f"Task error: {text}")
-                return {"message": "Task started"}
-        except aiohttp.ClientError as e:
-            raise HTTPException(status_code=500, detail=f"Task request failed: {str(e)}")
+async def parse_endpoint(request: Request, url: str, priority: str = "interactive"):
+    session = app.state.http_session
+    try:
+        async with session.post(
+            f"{PARSER_URL}/parse_celery",
+            params={"url": url, "priority": priority},
+            headers=forwarded_headers(request),
+        ) as resp:
+            if resp.status != 200:
+                text = await resp.text()
+                raise HTTPException(status_code=resp.status, detail=f"Task error: {text}", headers=retry_headers(resp))
+            return await resp.json()
+    except aiohttp.ClientError as e:
+        raise HTTPException(status_code=500, detail=f"Task request failed: {str(e)}")
+
+
+@app.post("/parse_batch")
+async def parse_batch_endpoint(data: ParseBatchRequest):
+    session = app.state.http_session
+    try:
+        async with session.post(f"{PARSER_URL}/parse_batch", json=data.model_dump()) as resp:
+            if resp.status != 200:
+                text = await resp.text()
+                raise HTTPException(status_code=resp.status, detail=f"Parser error: {text}")
+            return await resp.json()
+    except aiohttp.ClientError as e:
+        raise HTTPException(status_code=500, detail=f"Parser request failed: {str(e)}")
+
+
+@app.post("/parse_batch_celery")
+async def parse_batch_celery_endpoint(request: Request, data: ParseBatchRequest, priority: str = "bulk"):
+    session = app.state.http_session
+    try:
+        async with session.post(
+            f"{PARSER_URL}/parse_batch_celery",
+            params={"priority": priority},
+            json=data.model_dump(),
+            headers=forwarded_headers(request),
+        ) as resp:
+            if resp.status != 200:
+                text = await resp.text()
+                raise HTTPException(status_code=resp.status, detail=f"Task error: {text}", headers=retry_headers(resp))
+            return await resp.json()
+    except aiohttp.ClientError as e:
+        raise HTTPException(status_code=500, detail=f"Task request failed: {str(e)}")
+
+
+@app.post("/crawl")
+async def crawl_endpoint(request: Request, data: CrawlRequest):
+    session = app.state.http_session
+    try:
+        async with session.post(
+            f"{PARSER_URL}/crawl", json=data.model_dump(), headers=forwarded_headers(request)
+        ) as resp:
+            if resp.status != 200:
+                text = await resp.text()
+                raise HTTPException(status_code=resp.status, detail=f"Crawl error: {text}", headers=retry_headers(resp))
+            return await resp.json()
+    except aiohttp.ClientError as e:
+        raise HTTPException(status_code=500, detail=f"Crawl request failed: {str(e)}")
+
+
+@app.get("/crawl/{crawl_id}")
+async def crawl_status_endpoint(crawl_id: str):
+    session = app.state.http_session
+    try:
+        async with session.get(f"{PARSER_URL}/crawl/{crawl_id}") as resp:
+            if resp.status != 200:
+                text = await resp.text()
+                raise HTTPException(status_code=resp.status, detail=f"Crawl error: {text}")
+            return await resp.json()
+    except aiohttp.ClientError as e:
+        raise HTTPException(status_code=500, detail=f"Crawl request failed: {str(e)}")
 
 
 app.add_middleware(
@@ -136,3 +136,13 @@ class EvaluationRead(EvaluationDefault):
 
 class EvaluationCreateOrUpdate(EvaluationDefault):
     pass
+
+
+class ParseBatchRequest(SQLModel):
+    urls: List[str]
+
+
+class CrawlRequest(SQLModel):
+    seeds: List[str]
+    max_depth: int = 2
+    max_pages: int = 1000
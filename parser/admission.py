@@ -0,0 +1,130 @@
+import math
+import os
+import time
+
+from parser.celery_worker import BULK, INTERACTIVE, PRIORITIES, QUEUES, celery_app
+from parser.sharding import SHARD_QUEUES
+
+MAX_QUEUE_DEPTH = {
+    INTERACTIVE: int(os.getenv("PARSER_MAX_INTERACTIVE_QUEUE_DEPTH", "1000")),
+    BULK: int(os.getenv("PARSER_MAX_BULK_QUEUE_DEPTH", "10000")),
+}
+THROUGHPUT_WINDOW = int(os.getenv("PARSER_THROUGHPUT_WINDOW", "60"))
+MAX_RETRY_AFTER = int(os.getenv("PARSER_MAX_RETRY_AFTER", "300"))
+DEPTH_CACHE_TTL = float(os.getenv("PARSER_DEPTH_CACHE_TTL", "1"))
+# URLs a client may submit per minute; 0 disables the quota.
+CLIENT_QUOTA = int(os.getenv("PARSER_CLIENT_QUOTA", "0"))
+# Per-client overrides, e.g. "reports=5000,crawler=200".
+CLIENT_QUOTAS = {
+    client.strip(): int(quota)
+    for client, quota in (
+        item.split("=", 1) for item in os.getenv("PARSER_CLIENT_QUOTAS", "").split(",") if "=" in item
+    )
+}
+
+_depths = {}
+
+
+class Rejected(Exception):
+    def __init__(self, reason: str, retry_after: int):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+def step_key(queue: str, step: int) -> str:
+    # The Redis transport keeps one list per priority step: "queue", "queue:1", ...
+    return queue if step == 0 else f"{queue}{celery_app.conf.broker_transport_options.get('sep', ':')}{step}"
+
+
+def queue_keys(queue: str) -> list:
+    return [step_key(queue, step) for step in celery_app.conf.broker_transport_options.get("priority_steps", [0])]
+
+
+def depth_keys(priority: str) -> list:
+    if not SHARD_QUEUES:
+        return queue_keys(QUEUES[priority])
+    # Shards mix both priorities, so only the priority's own step is counted.
+    return [step_key(queue, PRIORITIES[priority]) for queue in SHARD_QUEUES]
+
+
+def completed_queue(delivery_info: dict):
+    queue = delivery_info.get("routing_key")
+    if queue in SHARD_QUEUES:
+        priority = delivery_info.get("priority") or 0
+        return QUEUES[INTERACTIVE if priority <= PRIORITIES[INTERACTIVE] else BULK]
+    return queue
+
+
+def throughput_key(queue: str, bucket: int) -> str:
+    return f"throughput:{queue}:{bucket}"
+
+
+async def record_completed(redis, queue: str):
+    if not queue:
+        return
+    key = throughput_key(queue, int(time.time()))
+    pipe = redis.pipeline(transaction=False)
+    pipe.incr(key)
+    pipe.expire(key, THROUGHPUT_WINDOW + 1)
+    await pipe.execute()
+
+
+async def queue_stats(redis, priority: str):
+    queue = QUEUES[priority]
+    cached = _depths.get(queue)
+    if cached is not None and time.monotonic() - cached[0] < DEPTH_CACHE_TTL:
+        return cached[1], cached[2]
+
+    now = int(time.time())
+    keys = depth_keys(priority)
+    pipe = redis.pipeline(transaction=False)
+    for key in keys:
+        pipe.llen(key)
+    for bucket in range(now - THROUGHPUT_WINDOW, now):
+        pipe.get(throughput_key(queue, bucket))
+    replies = await pipe.execute()
+    depth = sum(replies[:len(keys)])
+    rate = sum(int(done or 0) for done in replies[len(keys):]) / THROUGHPUT_WINDOW
+    _depths[queue] = (time.monotonic(), depth, rate)
+    return depth, rate
+
+
+def retry_after(excess: int, rate: float) -> int:
+    if rate <= 0:
+        return MAX_RETRY_AFTER
+    return max(1, min(MAX_RETRY_AFTER, math.ceil(excess / rate)))
+
+
+async def check_queue(redis, priority: str):
+    queue = QUEUES[priority]
+    depth, rate = await queue_stats(redis, priority)
+    limit = MAX_QUEUE_DEPTH[priority]
+    if limit > 0 and depth >= limit:
+        raise Rejected(f"Queue {queue} is full ({depth} tasks waiting)", retry_after(depth - limit + 1, rate))
+
+
+def client_quota(client: str) -> int:
+    return CLIENT_QUOTAS.get(client, CLIENT_QUOTA)
+
+
+async def check_quota(redis, client: str, cost: int = 1):
+    quota = client_quota(client)
+    if quota <= 0:
+        return
+    now = time.time()
+    window = int(now // 60)
+    key = f"quota:{client}:{window}"
+    pipe = redis.pipeline(transaction=False)
+    pipe.incrby(key, cost)
+    pipe.expire(key, 60)
+    used, _ = await pipe.execute()
+    if used > quota:
+        await redis.decrby(key, cost)
+        raise Rejected(f"Quota of {quota} URLs per minute exceeded for {client}",
+                       max(1, math.ceil((window + 1) * 60 - now)))
+
+
+async def admit(redis, priority: str, client: str, cost: int = 1):
+    await check_queue(redis, priority)
+    await check_quota(redis, client, cost)
@@ -0,0 +1,42 @@
+import os
+import time
+
+BREAKER_FAILURES = int(os.getenv("PARSER_BREAKER_FAILURES", "5"))
+BREAKER_RESET_TIMEOUT = float(os.getenv("PARSER_BREAKER_RESET_TIMEOUT", "30"))
+
+
+class CircuitOpenError(Exception):
+    pass
+
+
+class CircuitBreaker:
+    def __init__(self, failures: int = BREAKER_FAILURES, reset_timeout: float = BREAKER_RESET_TIMEOUT):
+        self.failures = failures
+        self.reset_timeout = reset_timeout
+        self._failures = {}
+        self._opened_at = {}
+        self._trial = {}
+
+    def check(self, host: str):
+        opened_at = self._opened_at.get(host)
+        if opened_at is None:
+            return
+        now = time.monotonic()
+        if now - max(opened_at, self._trial.get(host, opened_at)) < self.reset_timeout:
+            raise CircuitOpenError(f"Circuit open for {host}")
+        self._trial[host] = now
+
+    def record_success(self, host: str):
+        self._failures.pop(host, None)
+        self._opened_at.pop(host, None)
+        self._trial.pop(host, None)
+
+    def record_failure(self, host: str):
+        self._trial.pop(host, None)
+        count = self._failures.get(host, 0) + 1
+        self._failures[host] = count
+        if count >= self.failures:
+            self._opened_at[host] = time.monotonic()
+
+
+breaker = CircuitBreaker()
@@ -0,0 +1,33 @@
+import json
+import os
+import time
+
+from parser.urls import normalize_url
+
+CACHE_TTL = int(os.getenv("PARSER_CACHE_TTL", "3600"))
+CACHE_STALE_TTL = int(os.getenv("PARSER_CACHE_STALE_TTL", "86400"))
+
+
+def cache_key(url: str) -> str:
+    return f"page:{normalize_url(url)}"
+
+
+async def get_cached(redis, url: str):
+    raw = await redis.get(cache_key(url))
+    if raw is None:
+        return None
+    entry = json.loads(raw)
+    cached_at = entry.pop("cached_at")
+    return entry, time.time() - cached_at < CACHE_TTL
+
+
+async def set_cached(redis, url: str, name: str, description: str, parsed_at: str, extra: dict = None):
+    entry = {
+        "url": normalize_url(url),
+        "name": name,
+        "description": description,
+        "parsed_at": parsed_at,
+        "extra": extra,
+        "cached_at": time.time(),
+    }
+    await redis.set(cache_key(url), json.dumps(entry), ex=CACHE_TTL + CACHE_STALE_TTL)
@@ -1,4 +1,9 @@
+import os
 from celery import Celery
+from celery.signals import celeryd_after_setup
+
+from parser.schedule import SCHEDULE_PERIOD
+from parser.sharding import WORKER_SHARDS, queue_for_url, shard_queue
 
 celery_app = Celery(
     "worker",
@@ -7,6 +12,60 @@ celery_app = Celery(
     include=["tasks"],
 )
 
+INTERACTIVE = "interactive"
+BULK = "bulk"
+QUEUES = {INTERACTIVE: "parser.interactive", BULK: "parser.bulk"}
+# Redis priorities are served lowest first.
+PRIORITIES = {INTERACTIVE: 0, BULK: 6}
+
+PARTITION_MAINTENANCE_PERIOD = float(os.getenv("PARSER_PARTITION_MAINTENANCE_PERIOD", "3600"))
+
 celery_app.conf.task_routes = {
-    "tasks.parse_and_save_task": {"queue": "parser"},
+    "tasks.parse_and_save_task": {"queue": QUEUES[INTERACTIVE]},
+    "tasks.parse_batch_task": {"queue": QUEUES[BULK]},
+    "tasks.crawl_task": {"queue": QUEUES[BULK]},
+    # Only selects due pages and enqueues bulk batches, so it should not wait
+    # behind them.
+    "tasks.schedule_due_task": {"queue": QUEUES[INTERACTIVE]},
+    "tasks.maintain_partitions_task": {"queue": QUEUES[INTERACTIVE]},
+}
+celery_app.conf.beat_schedule = {
+    "schedule-due-pages": {
+        "task": "tasks.schedule_due_task",
+        "schedule": SCHEDULE_PERIOD,
+        "options": {"expires": SCHEDULE_PERIOD},
+    },
+    "maintain-partitions": {
+        "task": "tasks.maintain_partitions_task",
+        "schedule": PARTITION_MAINTENANCE_PERIOD,
+        "options": {"expires": PARTITION_MAINTENANCE_PERIOD},
+    },
+}
+# "priority" makes a worker drain its queues in the order given to -Q, so a
+# worker consuming parser.interactive,parser.bulk only takes bulk work when
+# no interactive task is waiting.
+celery_app.conf.broker_transport_options = {
+    "priority_steps": list(range(10)),
+    "sep": ":",
+    "queue_order_strategy": "priority",
 }
+celery_app.conf.task_default_priority = PRIORITIES[BULK]
+
+# Tasks only wait on coroutines running in the shared per-process event loop
+# (see runner.py), so cheap threads are enough to keep many fetches in flight.
+celery_app.conf.worker_pool = os.getenv("PARSER_WORKER_POOL", "threads")
+celery_app.conf.worker_concurrency = int(os.getenv("PARSER_WORKER_CONCURRENCY", "64"))
+celery_app.conf.worker_prefetch_multiplier = int(os.getenv("PARSER_WORKER_PREFETCH", "4"))
+
+
+def route(priority: str, url: str = None) -> dict:
+    # Shard queues carry both priorities; the Redis priority steps keep
+    # interactive work ahead of bulk within each one.
+    queue = (url and queue_for_url(url)) or QUEUES[priority]
+    return {"queue": queue, "priority": PRIORITIES[priority]}
+
+
+@celeryd_after_setup.connect
+def consume_shards(sender, instance, **kwargs):
+    for shard in WORKER_SHARDS:
+        instance.app.amqp.queues.select_add(shard_queue(shard))
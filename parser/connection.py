@@ -1,11 +1,26 @@
 from sqlmodel import SQLModel, Session, create_engine
-from contextlib import contextmanager
+from sqlmodel.ext.asyncio.session import AsyncSession
+from sqlalchemy.ext.asyncio import create_async_engine
+from contextlib import contextmanager, asynccontextmanager
 import os
 from dotenv import load_dotenv
 
+ASYNC_DRIVERS = {
+    "postgresql": "postgresql+asyncpg",
+    "sqlite": "sqlite+aiosqlite",
+}
+
+
+def async_db_url(url: str) -> str:
+    scheme, rest = url.split("://", 1)
+    return f"{ASYNC_DRIVERS.get(scheme.split('+')[0], scheme)}://{rest}"
+
+
 load_dotenv()
 db_url = os.getenv("DB_ADMIN")
-engine = create_engine(db_url, echo=True)
+db_echo = os.getenv("DB_ECHO", "1") == "1"
+engine = create_engine(db_url, echo=db_echo)
+async_engine = create_async_engine(async_db_url(db_url), echo=db_echo)
 
 
 def init_db():
@@ -19,3 +34,16 @@ def get_session():
         yield session
     finally:
         session.close()
+
+
+@asynccontextmanager
+async def get_async_session():
+    session = AsyncSession(async_engine)
+    try:
+        yield session
+    finally:
+        await session.close()
+
+
+async def close_async_engine():
+    await async_engine.dispose()
@@ -0,0 +1,140 @@
+import hashlib
+import json
+import os
+import uuid
+from urllib.parse import urljoin, urlsplit
+from xml.etree import ElementTree
+
+from parser.urls import normalize_url
+
+CRAWL_BATCH = int(os.getenv("PARSER_CRAWL_BATCH", "50"))
+CRAWL_TTL = int(os.getenv("PARSER_CRAWL_TTL", str(7 * 24 * 3600)))
+# 8 Mbit (1 MiB) per crawl holds ~800k URLs at a 1% false-positive rate.
+BLOOM_BITS = int(os.getenv("PARSER_BLOOM_BITS", str(8 * 1024 * 1024)))
+BLOOM_HASHES = int(os.getenv("PARSER_BLOOM_HASHES", "7"))
+
+# Marks the URL's bits in the Bloom filter and queues it if any bit was new.
+# Counted entries (pages, not sitemaps) are refused once max_pages is reached.
+PUSH_SCRIPT = """
+local counted = ARGV[2] == '1'
+if counted then
+    local queued = tonumber(redis.call('HGET', KEYS[2], 'queued') or '0')
+    local limit = tonumber(redis.call('HGET', KEYS[2], 'max_pages') or '0')
+    if queued >= limit then
+        return -1
+    end
+end
+local new = false
+for i = 4, #ARGV do
+    if redis.call('SETBIT', KEYS[1], ARGV[i], 1) == 0 then
+        new = true
+    end
+end
+if not new then
+    return 0
+end
+if counted then
+    redis.call('HINCRBY', KEYS[2], 'queued', 1)
+end
+redis.call('RPUSH', KEYS[3], ARGV[1])
+redis.call('EXPIRE', KEYS[1], ARGV[3])
+redis.call('EXPIRE', KEYS[3], ARGV[3])
+return 1
+"""
+
+
+def crawl_keys(crawl_id: str):
+    prefix = f"crawl:{crawl_id}"
+    return f"{prefix}:seen", f"{prefix}:meta", f"{prefix}:frontier"
+
+
+def bloom_positions(url: str) -> list:
+    digest = hashlib.blake2b(url.encode(), digest_size=16).digest()
+    h1 = int.from_bytes(digest[:8], "big")
+    h2 = int.from_bytes(digest[8:], "big") | 1
+    return [(h1 + i * h2) % BLOOM_BITS for i in range(BLOOM_HASHES)]
+
+
+def site_of(url: str) -> str:
+    host = urlsplit(url).hostname or ""
+    return host[4:] if host.startswith("www.") else host
+
+
+def is_sitemap(url: str) -> bool:
+    return urlsplit(url).path.endswith(".xml")
+
+
+def same_site_links(page_url: str, links: list, sites: set) -> list:
+    found = []
+    for link in links:
+        try:
+            url = normalize_url(urljoin(page_url, link.strip()))
+        except ValueError:
+            continue
+        if urlsplit(url).scheme in ("http", "https") and site_of(url) in sites:
+            found.append(url)
+    return list(dict.fromkeys(found))
+
+
+def parse_sitemap(body: bytes):
+    root = ElementTree.fromstring(body)
+    locs = [el.text.strip() for el in root.iter() if el.tag.endswith("loc") and el.text]
+    if root.tag.endswith("sitemapindex"):
+        return [], locs
+    return locs, []
+
+
+async def push(redis, crawl_id: str, urls: list, depth: int, sitemap: bool = False) -> int:
+    seen, meta, frontier = crawl_keys(crawl_id)
+    script = redis.register_script(PUSH_SCRIPT)
+    pipe = redis.pipeline(transaction=False)
+    for url in urls:
+        entry = json.dumps({"url": url, "depth": depth, "sitemap": sitemap})
+        args = [entry, "0" if sitemap else "1", CRAWL_TTL, *bloom_positions(url)]
+        await script(keys=[seen, meta, frontier], args=args, client=pipe)
+    return sum(added == 1 for added in await pipe.execute())
+
+
+async def start_crawl(redis, seeds: list, max_depth: int, max_pages: int) -> tuple:
+    crawl_id = uuid.uuid4().hex
+    seeds = [normalize_url(url) for url in seeds]
+    _, meta, _ = crawl_keys(crawl_id)
+    await redis.hset(meta, mapping={
+        "max_depth": max_depth,
+        "max_pages": max_pages,
+        "sites": " ".join(sorted({site_of(url) for url in seeds})),
+        "queued": 0,
+        "parsed": 0,
+        "failed": 0,
+    })
+    await redis.expire(meta, CRAWL_TTL)
+    queued = await push(redis, crawl_id, [url for url in seeds if is_sitemap(url)], 0, sitemap=True)
+    queued += await push(redis, crawl_id, [url for url in seeds if not is_sitemap(url)], 0)
+    return crawl_id, queued
+
+
+async def crawl_meta(redis, crawl_id: str):
+    _, meta, frontier = crawl_keys(crawl_id)
+    raw = await redis.hgetall(meta)
+    if not raw:
+        return None
+    return {
+        "max_depth": int(raw["max_depth"]),
+        "max_pages": int(raw["max_pages"]),
+        "sites": set(raw["sites"].split()),
+        "queued": int(raw["queued"]),
+        "parsed": int(raw["parsed"]),
+        "failed": int(raw["failed"]),
+        "frontier": await redis.llen(frontier),
+    }
+
+
+async def pop(redis, crawl_id: str, count: int = CRAWL_BATCH) -> list:
+    _, _, frontier = crawl_keys(crawl_id)
+    entries = await redis.lpop(frontier, count)
+    return [json.loads(entry) for entry in entries or []]
+
+
+async def count(redis, crawl_id: str, field: str):
+    _, meta, _ = crawl_keys(crawl_id)
+    await redis.hincrby(meta, field, 1)
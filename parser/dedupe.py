@@ -0,0 +1,71 @@
+import os
+import uuid
+
+from parser.urls import normalize_url
+
+DEDUPE_TTL = int(os.getenv("PARSER_DEDUPE_TTL", "3600"))
+DEDUPE_WINDOW = int(os.getenv("PARSER_DEDUPE_WINDOW", "10"))
+
+# Only shorten the key if it still belongs to the finishing task.
+RELEASE_SCRIPT = """
+if redis.call('GET', KEYS[1]) ~= ARGV[1] then
+    return 0
+end
+if tonumber(ARGV[2]) > 0 then
+    return redis.call('EXPIRE', KEYS[1], ARGV[2])
+end
+return redis.call('DEL', KEYS[1])
+"""
+
+
+def inflight_key(url: str) -> str:
+    return f"inflight:{normalize_url(url)}"
+
+
+async def claim(redis, url: str, task_id: str = None):
+    claimed = await claim_many(redis, [url], task_id)
+    return claimed[url]
+
+
+async def claim_many(redis, urls: list, task_id: str = None) -> dict:
+    task_id = task_id or uuid.uuid4().hex
+    claimed = {}
+    pending = list(dict.fromkeys(urls))
+    while pending:
+        keys = [inflight_key(url) for url in pending]
+        pipe = redis.pipeline(transaction=False)
+        for key in keys:
+            pipe.set(key, task_id, nx=True, ex=DEDUPE_TTL)
+        created = await pipe.execute()
+
+        pipe = redis.pipeline(transaction=False)
+        for key, ok in zip(keys, created):
+            if not ok:
+                pipe.get(key)
+        existing = iter(await pipe.execute())
+
+        retry = []
+        for url, ok in zip(pending, created):
+            if ok:
+                claimed[url] = (task_id, True)
+                continue
+            owner = next(existing)
+            if owner:
+                claimed[url] = (owner, False)
+            else:
+                # The other claim expired between SET NX and GET; claim again.
+                retry.append(url)
+        pending = retry
+    return {url: claimed[url] for url in dict.fromkeys(urls)}
+
+
+async def unclaim(redis, urls: list):
+    await redis.delete(*[inflight_key(url) for url in urls])
+
+
+async def release(redis, urls: list, task_id: str, window: int = DEDUPE_WINDOW):
+    script = redis.register_script(RELEASE_SCRIPT)
+    pipe = redis.pipeline(transaction=False)
+    for url in urls:
+        await script(keys=[inflight_key(url)], args=[task_id, window], client=pipe)
+    await pipe.execute()
@@ -0,0 +1,401 @@
+import os
+from abc import ABC, abstractmethod
+from functools import lru_cache
+from html.parser import HTMLParser
+from typing import Callable, NamedTuple, Optional
+from urllib.parse import urljoin, urlsplit
+from bs4 import BeautifulSoup
+
+EXTRACTOR = os.getenv("PARSER_EXTRACTOR", "htmlparser")
+FEED_SIZE = 8192
+
+NO_NAME = "No name"
+NO_DESCRIPTION = "No description"
+
+
+class HeadParser(HTMLParser):
+    def __init__(self, stop_at_head: bool = True):
+        super().__init__(convert_charrefs=True)
+        self.stop_at_head = stop_at_head
+        self.title = None
+        self.description = None
+        self.has_title = False
+        self.has_description = False
+        self.head_closed = False
+        self._in_title = False
+        self._title_nested = False
+
+    @property
+    def done(self) -> bool:
+        if self.stop_at_head and self.head_closed:
+            return True
+        return self.has_title and self.has_description and not self._in_title
+
+    def handle_starttag(self, tag, attrs):
+        if self._in_title:
+            self._title_nested = True
+        if tag == "title" and not self.has_title:
+            self.has_title = True
+            self._in_title = True
+        elif tag == "meta" and not self.has_description:
+            attrs = dict(attrs)
+            if attrs.get("name") == "description":
+                self.has_description = True
+                self.description = attrs.get("content")
+        elif tag == "body":
+            self.head_closed = True
+
+    def handle_endtag(self, tag):
+        if tag == "title":
+            self._in_title = False
+        elif tag == "head":
+            self.head_closed = True
+
+    def handle_data(self, data):
+        if self._in_title:
+            self.title = (self.title or "") + data
+
+    def result(self):
+        return make_result(None if self._title_nested else self.title, self.description)
+
+
+class Field(NamedTuple):
+    """One extracted value: the first, all or the count of matching tags.
+
+    A tag matches when each attribute in ``match`` contains the given token.
+    The value is ``attr`` of the tag, or its text when ``attr`` is None.
+    """
+    name: str
+    tag: str
+    match: dict = {}
+    attr: Optional[str] = None
+    aggregate: str = "first"
+    keep: Optional[Callable] = None
+    in_head: bool = True
+
+
+@lru_cache(maxsize=1024)
+def host_of(url: str) -> Optional[str]:
+    return urlsplit(url).hostname
+
+
+def is_outbound(href: str, url: str = None) -> bool:
+    # Runs for every <a> on the page: relative links are same-host by
+    # definition, so only absolute ones are split.
+    prefix = href[:8].lower()
+    if prefix.startswith("//"):
+        href = "http:" + href
+    elif not prefix.startswith(("http://", "https://")):
+        return False
+    return url is None or host_of(href) != host_of(url)
+
+
+FIELDS = {}
+
+
+def register(*fields: Field):
+    for field in fields:
+        FIELDS[field.name] = field
+
+
+register(
+    Field("og_title", "meta", {"property": "og:title"}, "content"),
+    Field("og_image", "meta", {"property": "og:image"}, "content"),
+    Field("canonical", "link", {"rel": "canonical"}, "href"),
+    Field("lang", "html", attr="lang"),
+    Field("h1", "h1", in_head=False),
+    Field("outbound_links", "a", attr="href", aggregate="count", keep=is_outbound, in_head=False),
+)
+
+# Internal fields used by the crawler, never stored on the page.
+LINK_FIELDS = (
+    Field("links", "a", attr="href", aggregate="all", in_head=False),
+    Field("base", "base", attr="href"),
+)
+
+# Body fields (h1, outbound_links) are opt-in: enabling any of them means
+# fetches read past </head> (see tasks.read_head).
+DEFAULT_FIELDS = [name for name, field in FIELDS.items() if field.in_head]
+ENABLED_FIELDS = [name for name in os.getenv("PARSER_FIELDS", ",".join(DEFAULT_FIELDS)).split(",") if name]
+
+
+class FieldTable:
+    """Registered fields indexed by tag, so one scan serves all of them."""
+
+    def __init__(self, fields):
+        self.fields = list(fields)
+        self.by_tag = {}
+        for field in self.fields:
+            self.by_tag.setdefault(field.tag, []).append(field)
+        self.needs_body = any(not field.in_head for field in self.fields)
+
+    def __bool__(self):
+        return bool(self.fields)
+
+
+_tables = {}
+
+
+def get_field_table(names=None, links: bool = False) -> FieldTable:
+    key = (tuple(ENABLED_FIELDS if names is None else names), links)
+    if key not in _tables:
+        fields = [FIELDS[name] for name in key[0]]
+        _tables[key] = FieldTable(fields + list(LINK_FIELDS) if links else fields)
+    return _tables[key]
+
+
+def tag_matches(field: Field, attrs: dict) -> bool:
+    return all(token in (attrs.get(name) or "").lower().split() for name, token in field.match.items())
+
+
+class FieldCollector:
+    def __init__(self, table: FieldTable, url: str = None):
+        self.table = table
+        self.url = url
+        self.values = {}
+
+    def start(self, tag: str, attrs: dict) -> list:
+        """Records attribute values and returns the fields waiting for this tag's text."""
+        pending = []
+        for field in self.table.by_tag.get(tag, ()):
+            if field.aggregate == "first" and field.name in self.values:
+                continue
+            if not tag_matches(field, attrs):
+                continue
+            if field.attr is None:
+                pending.append(field)
+            else:
+                self.add(field, attrs.get(field.attr))
+        return pending
+
+    def add(self, field: Field, value: Optional[str]):
+        if value is None:
+            return
+        value = value.strip()
+        if not value or (field.keep is not None and not field.keep(value, self.url)):
+            return
+        if field.aggregate == "count":
+            self.values[field.name] = self.values.get(field.name, 0) + 1
+        elif field.aggregate == "all":
+            self.values.setdefault(field.name, []).append(value)
+        else:
+            self.values.setdefault(field.name, value)
+
+    @property
+    def complete(self) -> bool:
+        """Whether reading further could not change the result."""
+        return all(field.aggregate == "first" and field.name in self.values for field in self.table.fields)
+
+    def result(self) -> dict:
+        defaults = {"count": 0, "all": [], "first": None}
+        return {field.name: self.values.get(field.name, defaults[field.aggregate]) for field in self.table.fields}
+
+
+class FieldParser(HeadParser):
+    """HeadParser that also fills a FieldCollector during the same scan."""
+
+    def __init__(self, table: FieldTable, url: str = None, stop_at_head: bool = True):
+        super().__init__(stop_at_head=stop_at_head)
+        self.collector = FieldCollector(table, url)
+        self._capturing = []
+
+    @property
+    def done(self) -> bool:
+        if not self.stop_at_head:
+            return super().done and self.collector.complete
+        if not self.collector.table:
+            return super().done
+        if self.collector.table.needs_body:
+            return False
+        return self.head_closed and not self._in_title
+
+    def handle_starttag(self, tag, attrs):
+        for field in self.collector.start(tag, dict(attrs)):
+            self._capturing.append((field, tag, []))
+        super().handle_starttag(tag, attrs)
+
+    def handle_endtag(self, tag):
+        still_open = []
+        for field, opened, parts in self._capturing:
+            if opened == tag:
+                self.collector.add(field, "".join(parts))
+            else:
+                still_open.append((field, opened, parts))
+        self._capturing = still_open
+        super().handle_endtag(tag)
+
+    def handle_data(self, data):
+        for _, _, parts in self._capturing:
+            parts.append(data)
+        super().handle_data(data)
+
+
+class Extracted(NamedTuple):
+    name: str
+    description: str
+    fields: dict
+    links: list = []
+
+
+def make_extracted(name_description, values: dict) -> Extracted:
+    links = values.pop("links", None)
+    base = values.pop("base", None)
+    if links and base:
+        links = [urljoin(base, link) for link in links]
+    return Extracted(*name_description, values, links or [])
+
+
+def make_result(title, description):
+    name = title.strip() if title is not None else NO_NAME
+    description = description.strip() if description else NO_DESCRIPTION
+    return name, description
+
+
+class Extractor(ABC):
+    @abstractmethod
+    def extract(self, html: str):
+        """(name, description) of the page."""
+
+    @abstractmethod
+    def extract_page(self, html: str, url: str = None, table: FieldTable = None) -> Extracted:
+        """Name, description and the fields in ``table`` in one parse."""
+
+
+class BeautifulSoupExtractor(Extractor):
+    def extract(self, html: str):
+        return self._extract(BeautifulSoup(html, "html.parser"))
+
+    def extract_page(self, html: str, url: str = None, table: FieldTable = None) -> Extracted:
+        table = table if table is not None else get_field_table()
+        soup = BeautifulSoup(html, "html.parser")
+        collector = FieldCollector(table, url)
+        if table:
+            for el in soup.find_all(list(table.by_tag)):
+                attrs = {k: " ".join(v) if isinstance(v, list) else v for k, v in el.attrs.items()}
+                for field in collector.start(el.name, attrs):
+                    collector.add(field, el.get_text())
+        return make_extracted(self._extract(soup), collector.result())
+
+    def _extract(self, soup):
+        title = soup.title.string if soup.title else None
+
+        description = None
+        meta_tag = soup.find("meta", attrs={"name": "description"})
+        if meta_tag:
+            description = meta_tag.get("content")
+
+        return make_result(title, description)
+
+
+class LxmlExtractor(Extractor):
+    def __init__(self):
+        import lxml.html
+        from lxml.etree import ParserError
+
+        self._fromstring = lxml.html.document_fromstring
+        self._parser_error = ParserError
+        self._utf8_parser = lxml.html.HTMLParser(encoding="utf-8")
+
+    def _parse(self, html: str):
+        try:
+            try:
+                return self._fromstring(html)
+            except ValueError:
+                # lxml refuses str input that carries an XML encoding
+                # declaration (XHTML), so hand it UTF-8 bytes instead.
+                return self._fromstring(html.encode("utf-8"), parser=self._utf8_parser)
+        except self._parser_error:
+            return None
+
+    def extract(self, html: str):
+        doc = self._parse(html)
+        if doc is None:
+            return make_result(None, None)
+        return self._extract(doc)
+
+    def extract_page(self, html: str, url: str = None, table: FieldTable = None) -> Extracted:
+        table = table if table is not None else get_field_table()
+        collector = FieldCollector(table, url)
+        doc = self._parse(html)
+        if doc is None:
+            return make_extracted(make_result(None, None), collector.result())
+        if table:
+            for el in doc.iter(*table.by_tag):
+                for field in collector.start(el.tag, dict(el.attrib)):
+                    collector.add(field, el.text_content())
+        return make_extracted(self._extract(doc), collector.result())
+
+    def _extract(self, doc):
+        title = None
+        title_tag = doc.find(".//title")
+        if title_tag is not None and len(title_tag) == 0:
+            title = title_tag.text
+
+        description = None
+        meta_tags = doc.xpath("//meta[@name='description']")
+        if meta_tags:
+            description = meta_tags[0].get("content")
+
+        return make_result(title, description)
+
+
+class HTMLParserExtractor(Extractor):
+    def extract(self, html: str):
+        parser = HeadParser(stop_at_head=False)
+        for i in range(0, len(html), FEED_SIZE):
+            parser.feed(html[i:i + FEED_SIZE])
+            if parser.done:
+                break
+        else:
+            parser.close()
+        return parser.result()
+
+    def extract_page(self, html: str, url: str = None, table: FieldTable = None) -> Extracted:
+        table = table if table is not None else get_field_table()
+        parser = FieldParser(table, url, stop_at_head=False)
+        for i in range(0, len(html), FEED_SIZE):
+            parser.feed(html[i:i + FEED_SIZE])
+            if parser.done:
+                break
+        else:
+            parser.close()
+        return make_extracted(parser.result(), parser.collector.result())
+
+
+EXTRACTORS = {
+    "bs4": BeautifulSoupExtractor,
+    "lxml": LxmlExtractor,
+    "htmlparser": HTMLParserExtractor,
+}
+
+_extractors = {}
+
+
+def get_extractor(name: str = None) -> Extractor:
+    name = name or EXTRACTOR
+    if name not in _extractors:
+        if name not in EXTRACTORS:
+            raise ValueError(f"Unknown extractor: {name}")
+        _extractors[name] = EXTRACTORS[name]()
+    return _extractors[name]
+
+
+def extract(html: str):
+    return get_extractor().extract(html)
+
+
+def extract_page(html: str, url: str = None, links: bool = False) -> Extracted:
+    return get_extractor().extract_page(html, url, get_field_table(links=links))
+
+
+def extract_bytes(body: bytes, encoding: str = None, url: str = None, links: bool = False) -> Extracted:
+    try:
+        html = body.decode(encoding or "utf-8", errors="replace")
+    except LookupError:
+        html = body.decode("utf-8", errors="replace")
+    return extract_page(html, url, links)
+
+
+def warm_up() -> int:
+    get_extractor()
+    return os.getpid()
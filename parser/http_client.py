@@ -0,0 +1,68 @@
+import asyncio
+import os
+import random
+import aiohttp
+
+from parser.metrics import trace_config
+from parser.resolver import DNS_SHARED, SharedResolver
+
+HTTP_LIMIT = int(os.getenv("PARSER_HTTP_LIMIT", "100"))
+HTTP_LIMIT_PER_HOST = int(os.getenv("PARSER_HTTP_LIMIT_PER_HOST", "8"))
+HTTP_KEEPALIVE_TIMEOUT = float(os.getenv("PARSER_HTTP_KEEPALIVE_TIMEOUT", "30"))
+HTTP_DNS_CACHE_TTL = int(os.getenv("PARSER_HTTP_DNS_CACHE_TTL", "300"))
+HTTP_CONNECT_TIMEOUT = float(os.getenv("PARSER_HTTP_CONNECT_TIMEOUT", "5"))
+HTTP_READ_TIMEOUT = float(os.getenv("PARSER_HTTP_READ_TIMEOUT", "10"))
+HTTP_TOTAL_TIMEOUT = float(os.getenv("PARSER_HTTP_TOTAL_TIMEOUT", "30"))
+HTTP_RETRIES = int(os.getenv("PARSER_HTTP_RETRIES", "2"))
+HTTP_BACKOFF_BASE = float(os.getenv("PARSER_HTTP_BACKOFF_BASE", "0.5"))
+HTTP_BACKOFF_MAX = float(os.getenv("PARSER_HTTP_BACKOFF_MAX", "10"))
+
+RETRYABLE_STATUSES = {429, 500, 502, 503, 504}
+RETRYABLE_ERRORS = (aiohttp.ClientConnectionError, aiohttp.ClientPayloadError, asyncio.TimeoutError)
+
+_session = None
+_session_loop = None
+
+
+def create_http_session() -> aiohttp.ClientSession:
+    connector = aiohttp.TCPConnector(
+        limit=HTTP_LIMIT,
+        limit_per_host=HTTP_LIMIT_PER_HOST,
+        keepalive_timeout=HTTP_KEEPALIVE_TIMEOUT,
+        ttl_dns_cache=HTTP_DNS_CACHE_TTL,
+        use_dns_cache=True,
+        resolver=SharedResolver() if DNS_SHARED else None,
+    )
+    timeout = aiohttp.ClientTimeout(
+        total=HTTP_TOTAL_TIMEOUT,
+        sock_connect=HTTP_CONNECT_TIMEOUT,
+        sock_read=HTTP_READ_TIMEOUT,
+    )
+    return aiohttp.ClientSession(connector=connector, timeout=timeout, trace_configs=[trace_config()])
+
+
+class RetryableStatus(Exception):
+    def __init__(self, status: int):
+        super().__init__(f"HTTP {status}")
+        self.status = status
+
+
+def backoff(attempt: int) -> float:
+    return random.uniform(0, min(HTTP_BACKOFF_MAX, HTTP_BACKOFF_BASE * 2 ** attempt))
+
+
+def get_http_session() -> aiohttp.ClientSession:
+    global _session, _session_loop
+    loop = asyncio.get_running_loop()
+    if _session is None or _session.closed or _session_loop is not loop:
+        _session = create_http_session()
+        _session_loop = loop
+    return _session
+
+
+async def close_http_session():
+    global _session, _session_loop
+    if _session is not None and not _session.closed and _session_loop is asyncio.get_running_loop():
+        await _session.close()
+    _session = None
+    _session_loop = None
@@ -1,20 +1,152 @@
-from fastapi import FastAPI
+import uuid
+from typing import Literal
+from fastapi import FastAPI, HTTPException, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
-from parser.tasks import parse_and_save_task, parse
+from fastapi.responses import JSONResponse
+from parser.admission import Rejected, admit
+from parser.cache import get_cached
+from parser.celery_worker import BULK, INTERACTIVE, route
+from parser.connection import close_async_engine
+from parser.dedupe import claim, claim_many, unclaim
+from parser.http_client import close_http_session
+from parser.metrics import render
+from parser.crawl import crawl_meta, start_crawl
+from parser.models import CrawlRequest, ParseBatchRequest
+from parser.pool import start_pool, close_pool
+from parser.redis_client import get_redis, close_redis
+from parser.robots import Disallowed
+from parser.sharding import split_by_shard
+from parser.tasks import crawl_task, parse_and_save_task, parse_batch_task, parse, parse_many
 
 app = FastAPI()
 
+Priority = Literal["interactive", "bulk"]
+
+
+@app.exception_handler(Rejected)
+async def rejected_handler(request: Request, exc: Rejected):
+    return JSONResponse(status_code=429, content={"detail": exc.reason},
+                        headers={"Retry-After": str(exc.retry_after)})
+
+
+@app.exception_handler(Disallowed)
+async def disallowed_handler(request: Request, exc: Disallowed):
+    return JSONResponse(status_code=403, content={"detail": str(exc)})
+
+
+def client_id(request: Request = None) -> str:
+    if request is None:
+        return "anonymous"
+    return request.headers.get("X-Client-Id") or (request.client.host if request.client else "anonymous")
+
+
+@app.on_event("startup")
+async def on_startup():
+    await start_pool()
+
+
+@app.on_event("shutdown")
+async def on_shutdown():
+    await close_pool()
+    await close_http_session()
+    await close_redis()
+    await close_async_engine()
+
+
+async def enqueue_parse(url: str, priority: str = INTERACTIVE):
+    redis = get_redis()
+    task_id, created = await claim(redis, url)
+    if created:
+        try:
+            parse_and_save_task.apply_async(args=[url], task_id=task_id, **route(priority, url))
+        except Exception:
+            await unclaim(redis, [url])
+            raise
+    return task_id, created
+
 
 @app.post("/parse")
-async def parse_endpoint(url: str):
-    await parse(url)
-    return {"message": "Parsing completed"}
+async def parse_endpoint(url: str, request: Request = None):
+    cached = await get_cached(get_redis(), url)
+    if cached is not None:
+        entry, fresh = cached
+        if not fresh:
+            try:
+                await admit(get_redis(), BULK, client_id(request))
+                await enqueue_parse(url, BULK)
+            except Rejected:
+                # Serve the stale entry and leave the refresh to a later hit.
+                pass
+        return {"message": "Parsing completed", "cached": True, "stale": not fresh, **entry}
+    result = await parse(url)
+    return {"message": "Parsing completed", "cached": False, "stale": False, **result}
 
 
 @app.post("/parse_celery")
-async def parse_endpoint(url: str):
-    parse_and_save_task.apply_async(args=[url], queue='parser')
-    return {"message": "Task started"}
+async def parse_endpoint(url: str, priority: Priority = INTERACTIVE, request: Request = None):
+    await admit(get_redis(), priority, client_id(request))
+    task_id, created = await enqueue_parse(url, priority)
+    if not created:
+        return {"message": "Task already queued", "task_id": task_id}
+    return {"message": "Task started", "task_id": task_id}
+
+
+@app.get("/metrics")
+def metrics_endpoint():
+    content, content_type = render()
+    return Response(content=content, media_type=content_type)
+
+
+@app.post("/parse_batch")
+async def parse_batch_endpoint(data: ParseBatchRequest):
+    results = await parse_many(data.urls)
+    return {"message": "Parsing completed", "results": results}
+
+
+@app.post("/parse_batch_celery")
+async def parse_batch_celery_endpoint(data: ParseBatchRequest, priority: Priority = BULK, request: Request = None):
+    redis = get_redis()
+    await admit(redis, priority, client_id(request), len(data.urls))
+    task_ids, attached = [], {}
+    # With sharding on, each domain's URLs go to its own shard queue.
+    for group in split_by_shard(data.urls):
+        task_id = uuid.uuid4().hex
+        claimed = await claim_many(redis, group, task_id)
+        urls = [url for url, (_, created) in claimed.items() if created]
+        attached.update({url: owner for url, (owner, created) in claimed.items() if not created})
+        if not urls:
+            continue
+        try:
+            parse_batch_task.apply_async(args=[urls, priority], task_id=task_id, **route(priority, urls[0]))
+        except Exception:
+            await unclaim(redis, urls)
+            raise
+        task_ids.append(task_id)
+    if not task_ids:
+        return {"message": "Task already queued", "task_id": None, "attached": attached}
+    result = {"message": "Task started", "task_id": task_ids[0], "attached": attached}
+    if len(task_ids) > 1:
+        result["task_ids"] = task_ids
+    return result
+
+
+@app.post("/crawl")
+async def crawl_endpoint(data: CrawlRequest, request: Request = None):
+    redis = get_redis()
+    # Charged for every page the crawl may fetch, not just its seeds.
+    await admit(redis, BULK, client_id(request), data.max_pages)
+    crawl_id, queued = await start_crawl(redis, data.seeds, data.max_depth, data.max_pages)
+    seed = data.seeds[0] if data.seeds else None
+    crawl_task.apply_async(args=[crawl_id, seed], **route(BULK, seed))
+    return {"message": "Crawl started", "crawl_id": crawl_id, "queued": queued}
+
+
+@app.get("/crawl/{crawl_id}")
+async def crawl_status_endpoint(crawl_id: str):
+    meta = await crawl_meta(get_redis(), crawl_id)
+    if meta is None:
+        raise HTTPException(status_code=404, detail="Crawl not found")
+    return {"crawl_id": crawl_id, **meta, "sites": sorted(meta["sites"])}
 
 
 app.add_middleware(
@@ -0,0 +1,83 @@
+import os
+import time
+from contextlib import contextmanager
+import aiohttp
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Histogram, generate_latest
+from prometheus_client import multiprocess, start_http_server
+
+# With PROMETHEUS_MULTIPROC_DIR set, every process of one container writes its
+# samples to that directory and /metrics aggregates all of them. Files are
+# named by PID, so the directory must not be shared between containers.
+MULTIPROC_DIR = os.getenv("PROMETHEUS_MULTIPROC_DIR")
+# Workers have no API to serve /metrics from, so they listen on this port.
+METRICS_PORT = int(os.getenv("PARSER_METRICS_PORT", "0"))
+
+STAGE_SECONDS = Histogram(
+    "parser_stage_seconds",
+    "Time spent in each stage of parsing a page",
+    ["stage"],
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30),
+)
+QUEUE_WAIT_SECONDS = Histogram(
+    "parser_queue_wait_seconds",
+    "Time a task spent in the broker before a worker started it",
+    buckets=(0.01, 0.05, 0.1, 0.5, 1, 5, 10, 30, 60, 300, 900, 3600),
+)
+FETCHED_BYTES = Counter("parser_fetched_bytes", "Bytes read from remote pages")
+PAGES = Counter("parser_pages", "Pages parsed, by outcome", ["outcome"])
+ERRORS = Counter("parser_errors", "Parse failures, by stage and exception type", ["stage", "kind"])
+
+
+@contextmanager
+def timed(stage: str):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        STAGE_SECONDS.labels(stage).observe(time.perf_counter() - started)
+
+
+def record_error(stage: str, error: BaseException):
+    ERRORS.labels(stage, type(error).__name__).inc()
+
+
+def trace_config() -> aiohttp.TraceConfig:
+    config = aiohttp.TraceConfig()
+
+    def start(stage):
+        async def remember(session, context, params):
+            setattr(context, stage, time.perf_counter())
+        return remember
+
+    def end(stage):
+        async def observe(session, context, params):
+            STAGE_SECONDS.labels(stage).observe(time.perf_counter() - getattr(context, stage))
+        return observe
+
+    config.on_dns_resolvehost_start.append(start("dns"))
+    config.on_dns_resolvehost_end.append(end("dns"))
+    config.on_connection_create_start.append(start("connect"))
+    config.on_connection_create_end.append(end("connect"))
+    return config
+
+
+def get_registry():
+    if not MULTIPROC_DIR:
+        return REGISTRY
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    return registry
+
+
+def render():
+    return generate_latest(get_registry()), CONTENT_TYPE_LATEST
+
+
+def start_metrics_server(port: int = METRICS_PORT):
+    if port:
+        start_http_server(port, registry=get_registry())
+
+
+def mark_process_dead(pid: int):
+    if MULTIPROC_DIR:
+        multiprocess.mark_process_dead(pid)
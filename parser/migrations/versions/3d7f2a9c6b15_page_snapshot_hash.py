@@ -0,0 +1,29 @@
+"""page snapshot hash
+
+Revision ID: 3d7f2a9c6b15
+Revises: 9c4e1a2b7f30
+Create Date: 2026-10-18 14:26:40.118305
+
+"""
+from typing import Sequence, Union
+import sqlmodel
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3d7f2a9c6b15'
+down_revision: Union[str, None] = '9c4e1a2b7f30'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('page', sa.Column('snapshot_hash', sqlmodel.sql.sqltypes.AutoString(), nullable=True))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('page', 'snapshot_hash')
@@ -0,0 +1,40 @@
+"""page revisit schedule
+
+Revision ID: 4c9d2e8a1f57
+Revises: 7e1b5c3a8d62
+Create Date: 2026-10-18 17:40:22.318904
+
+"""
+from typing import Sequence, Union
+import sqlmodel
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '4c9d2e8a1f57'
+down_revision: Union[str, None] = '7e1b5c3a8d62'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('page', sa.Column('change_history', sa.Integer(), nullable=True))
+    op.add_column('page', sa.Column('revisit_interval', sa.Float(), nullable=True))
+    op.add_column('page', sa.Column('next_due_at', sa.DateTime(), nullable=True))
+    op.create_index(op.f('ix_page_next_due_at'), 'page', ['next_due_at'], unique=False)
+    # Existing pages start with no history and the default one day interval.
+    op.execute(
+        "UPDATE page SET change_history = 1, revisit_interval = 86400, "
+        "next_due_at = parsed_at + interval '1 day'"
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_page_next_due_at'), table_name='page')
+    op.drop_column('page', 'next_due_at')
+    op.drop_column('page', 'revisit_interval')
+    op.drop_column('page', 'change_history')
@@ -0,0 +1,39 @@
+"""page validators
+
+Revision ID: 5b2f0c7d9e41
+Revises: 0905bab1a682
+Create Date: 2026-10-18 10:12:40.118204
+
+"""
+from typing import Sequence, Union
+import sqlmodel
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5b2f0c7d9e41'
+down_revision: Union[str, None] = '0905bab1a682'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.alter_column('page', 'title', new_column_name='name')
+    op.add_column('page', sa.Column('description', sqlmodel.sql.sqltypes.AutoString(), nullable=True))
+    op.add_column('page', sa.Column('etag', sqlmodel.sql.sqltypes.AutoString(), nullable=True))
+    op.add_column('page', sa.Column('last_modified', sqlmodel.sql.sqltypes.AutoString(), nullable=True))
+    op.add_column('page', sa.Column('content_hash', sqlmodel.sql.sqltypes.AutoString(), nullable=True))
+    op.create_index(op.f('ix_page_url'), 'page', ['url'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_page_url'), table_name='page')
+    op.drop_column('page', 'content_hash')
+    op.drop_column('page', 'last_modified')
+    op.drop_column('page', 'etag')
+    op.drop_column('page', 'description')
+    op.alter_column('page', 'name', new_column_name='title')
@@ -0,0 +1,30 @@
+"""page extra fields
+
+Revision ID: 7e1b5c3a8d62
+Revises: 3d7f2a9c6b15
+Create Date: 2026-10-18 15:12:09.640271
+
+"""
+from typing import Sequence, Union
+import sqlmodel
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = '7e1b5c3a8d62'
+down_revision: Union[str, None] = '3d7f2a9c6b15'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('page', sa.Column('extra', postgresql.JSONB(astext_type=sa.Text()), nullable=True))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('page', 'extra')
@@ -0,0 +1,33 @@
+"""page unique url
+
+Revision ID: 9c4e1a2b7f30
+Revises: 5b2f0c7d9e41
+Create Date: 2026-10-18 11:03:17.502981
+
+"""
+from typing import Sequence, Union
+import sqlmodel
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '9c4e1a2b7f30'
+down_revision: Union[str, None] = '5b2f0c7d9e41'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # keep only the most recent row for every url before enforcing uniqueness
+    op.execute("DELETE FROM page a USING page b WHERE a.url = b.url AND a.id < b.id")
+    op.drop_index(op.f('ix_page_url'), table_name='page')
+    op.create_index(op.f('ix_page_url'), 'page', ['url'], unique=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_page_url'), table_name='page')
+    op.create_index(op.f('ix_page_url'), 'page', ['url'], unique=False)
@@ -0,0 +1,105 @@
+"""page partitioned by parsed_at
+
+Revision ID: b5e8f1c4a702
+Revises: 4c9d2e8a1f57
+Create Date: 2026-10-18 19:05:47.512630
+
+"""
+import os
+from datetime import date, datetime, timedelta
+from typing import Sequence, Union
+import sqlmodel
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b5e8f1c4a702'
+down_revision: Union[str, None] = '4c9d2e8a1f57'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+COLUMNS = (
+    "id, url, name, description, etag, last_modified, content_hash, snapshot_hash, extra, "
+    "parsed_at, change_history, revisit_interval, next_due_at"
+)
+# Same layout as parser/partitions.py, which keeps creating them from here on.
+PARTITION_DAYS = int(os.getenv("PARSER_PARTITION_DAYS", "7"))
+PARTITIONS_AHEAD = int(os.getenv("PARSER_PARTITIONS_AHEAD", "4"))
+
+
+def page_columns():
+    return [
+        sa.Column('id', sa.Integer(), server_default=sa.text("nextval('page_id_seq')"), nullable=False),
+        sa.Column('url', sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+        sa.Column('name', sqlmodel.sql.sqltypes.AutoString(), nullable=True),
+        sa.Column('description', sqlmodel.sql.sqltypes.AutoString(), nullable=True),
+        sa.Column('etag', sqlmodel.sql.sqltypes.AutoString(), nullable=True),
+        sa.Column('last_modified', sqlmodel.sql.sqltypes.AutoString(), nullable=True),
+        sa.Column('content_hash', sqlmodel.sql.sqltypes.AutoString(), nullable=True),
+        sa.Column('snapshot_hash', sqlmodel.sql.sqltypes.AutoString(), nullable=True),
+        sa.Column('extra', postgresql.JSONB(astext_type=sa.Text()), nullable=True),
+        sa.Column('parsed_at', sa.DateTime(), nullable=False),
+        sa.Column('change_history', sa.Integer(), nullable=True),
+        sa.Column('revisit_interval', sa.Float(), nullable=True),
+        sa.Column('next_due_at', sa.DateTime(), nullable=True),
+    ]
+
+
+def rename_old_table(old: str, new: str):
+    op.rename_table(old, new)
+    op.execute(f"ALTER TABLE {new} RENAME CONSTRAINT {old}_pkey TO {new}_pkey")
+    for column in ('url', 'next_due_at'):
+        op.execute(f"ALTER INDEX ix_{old}_{column} RENAME TO ix_{new}_{column}")
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    rename_old_table('page', 'page_unpartitioned')
+    # The partition key has to be part of the primary key, and url can no
+    # longer be unique (see writer.upsert_partitioned).
+    op.create_table('page',
+    *page_columns(),
+    sa.PrimaryKeyConstraint('id', 'parsed_at'),
+    postgresql_partition_by='RANGE (parsed_at)'
+    )
+    op.execute("ALTER SEQUENCE page_id_seq OWNED BY page.id")
+    op.create_index(op.f('ix_page_url'), 'page', ['url'], unique=False)
+    op.create_index(op.f('ix_page_next_due_at'), 'page', ['next_due_at'], unique=False)
+    op.create_index(op.f('ix_page_parsed_at'), 'page', ['parsed_at'], unique=False)
+
+    # Everything parsed before the current partition shares one history
+    # partition, which retention drops once all of it has expired.
+    # UTC, like parsed_at and parser/partitions.py.
+    ordinal = datetime.utcnow().date().toordinal()
+    start = date.fromordinal(ordinal - (ordinal - 1) % PARTITION_DAYS)
+    op.execute(f"CREATE TABLE page_history PARTITION OF page FOR VALUES FROM (MINVALUE) TO ('{start}')")
+    for _ in range(PARTITIONS_AHEAD + 1):
+        end = start + timedelta(days=PARTITION_DAYS)
+        op.execute(f"CREATE TABLE page_p{start:%Y%m%d} PARTITION OF page FOR VALUES FROM ('{start}') TO ('{end}')")
+        start = end
+    # Catches rows past the last partition if maintenance falls behind.
+    op.execute("CREATE TABLE page_default PARTITION OF page DEFAULT")
+
+    op.execute(f"INSERT INTO page ({COLUMNS}) SELECT {COLUMNS} FROM page_unpartitioned")
+    op.drop_table('page_unpartitioned')
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    rename_old_table('page', 'page_partitioned')
+    op.create_table('page',
+    *page_columns(),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.execute("ALTER SEQUENCE page_id_seq OWNED BY page.id")
+    op.create_index(op.f('ix_page_next_due_at'), 'page', ['next_due_at'], unique=False)
+    # Keep the most recent row per url in case a race left duplicates.
+    op.execute(
+        f"INSERT INTO page ({COLUMNS}) SELECT DISTINCT ON (url) {COLUMNS} FROM page_partitioned "
+        "ORDER BY url, parsed_at DESC, id DESC"
+    )
+    op.create_index(op.f('ix_page_url'), 'page', ['url'], unique=True)
+    op.execute("DROP TABLE page_partitioned CASCADE")
@@ -1,10 +1,40 @@
 from datetime import datetime
-from typing import Optional
+from typing import List, Optional
+from sqlalchemy import JSON, Column
+from sqlalchemy.dialects.postgresql import JSONB
 from sqlmodel import SQLModel, Field
 
 
 class Page(SQLModel, table=True):
     id: Optional[int] = Field(default=None, primary_key=True)
+    # Unique only on SQLite. On Postgres page is partitioned by parsed_at, and
+    # a unique index there would have to include parsed_at, so nothing stops
+    # two rows with one url. That also loses the single-statement
+    # INSERT ... ON CONFLICT (url) upsert (writer.upsert_pages): Postgres
+    # writes go through writer.upsert_partitioned, which locks each url and
+    # splits the batch into an INSERT and UPDATEs. Code that writes pages
+    # any other way has to keep urls unique itself.
+    url: str = Field(index=True, unique=True)
     name: str
     description: Optional[str] = None
-    parsed_at: datetime = Field(default_factory=datetime.utcnow)
+    etag: Optional[str] = None
+    last_modified: Optional[str] = None
+    content_hash: Optional[str] = None
+    snapshot_hash: Optional[str] = None
+    # Values of the registered extract.FIELDS, keyed by field name.
+    extra: Optional[dict] = Field(default=None, sa_column=Column(JSON().with_variant(JSONB(), "postgresql")))
+    parsed_at: datetime = Field(default_factory=datetime.utcnow, index=True)
+    # Revisit bookkeeping, see schedule.py.
+    change_history: Optional[int] = None
+    revisit_interval: Optional[float] = None
+    next_due_at: Optional[datetime] = Field(default=None, index=True)
+
+
+class ParseBatchRequest(SQLModel):
+    urls: List[str]
+
+
+class CrawlRequest(SQLModel):
+    seeds: List[str]
+    max_depth: int = 2
+    max_pages: int = 1000
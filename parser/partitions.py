@@ -0,0 +1,137 @@
+"""Create upcoming page partitions and drop expired ones (Postgres only).
+
+    python -m parser.partitions
+"""
+import logging
+import os
+import re
+from datetime import date, datetime, timedelta
+from sqlalchemy import text
+
+from parser.connection import engine
+
+# page is range-partitioned by parsed_at into partitions this many days wide.
+PARTITION_DAYS = int(os.getenv("PARSER_PARTITION_DAYS", "7"))
+PARTITIONS_AHEAD = int(os.getenv("PARSER_PARTITIONS_AHEAD", "4"))
+# Pages not parsed for this long are dropped with their partition; 0 keeps them.
+RETENTION_DAYS = int(os.getenv("PARSER_PAGE_RETENTION_DAYS", "0"))
+
+# Created by the migration; holds rows no range partition covers.
+DEFAULT_PARTITION = "page_default"
+
+BOUND_RE = re.compile(r"FROM \((MINVALUE|'[^']+')\) TO \((MAXVALUE|'[^']+')\)")
+
+logger = logging.getLogger(__name__)
+
+
+def partition_start(day: date) -> date:
+    # Aligned on day one of the proleptic calendar, so 7-day partitions start
+    # on Mondays and the same day always lands in the same partition.
+    ordinal = day.toordinal()
+    return date.fromordinal(ordinal - (ordinal - 1) % PARTITION_DAYS)
+
+
+def partition_name(start: date) -> str:
+    return f"page_p{start:%Y%m%d}"
+
+
+def planned_partitions(now: datetime = None, ahead: int = PARTITIONS_AHEAD) -> list:
+    start = partition_start((now or datetime.utcnow()).date())
+    planned = []
+    for _ in range(ahead + 1):
+        end = start + timedelta(days=PARTITION_DAYS)
+        planned.append((partition_name(start), start, end))
+        start = end
+    return planned
+
+
+def parse_bound(bound: str):
+    """(start, end) of a "FOR VALUES FROM (...) TO (...)" bound, None for MINVALUE/MAXVALUE."""
+    match = BOUND_RE.search(bound or "")
+    if match is None:
+        return None
+    return tuple(None if value.endswith("VALUE") else datetime.fromisoformat(value.strip("'"))
+                 for value in match.groups())
+
+
+def expired_partitions(bounds: dict, now: datetime = None, retention_days: int = RETENTION_DAYS) -> list:
+    if retention_days <= 0:
+        return []
+    cutoff = (now or datetime.utcnow()) - timedelta(days=retention_days)
+    return sorted(name for name, (_, end) in bounds.items() if end is not None and end <= cutoff)
+
+
+def partition_bounds(conn) -> dict:
+    rows = conn.execute(text(
+        "SELECT c.relname, pg_get_expr(c.relpartbound, c.oid) FROM pg_inherits i "
+        "JOIN pg_class c ON c.oid = i.inhrelid WHERE i.inhparent = 'page'::regclass"
+    )).all()
+    bounds = {name: parse_bound(bound) for name, bound in rows}
+    return {name: bound for name, bound in bounds.items() if bound is not None}
+
+
+def has_default_partition(conn) -> bool:
+    return conn.execute(text(
+        "SELECT 1 FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+        "WHERE i.inhparent = 'page'::regclass AND c.relname = :name"
+    ), {"name": DEFAULT_PARTITION}).first() is not None
+
+
+def create_partitions(conn, partitions: list) -> int:
+    """Create partitions, moving rows the default partition holds in their ranges.
+
+    Postgres refuses to create a partition while the default one has rows
+    that belong to it, so the default is detached until they have moved.
+    """
+    default = has_default_partition(conn)
+    if default:
+        conn.execute(text(f"ALTER TABLE page DETACH PARTITION {DEFAULT_PARTITION}"))
+    moved = 0
+    for name, start, end in partitions:
+        conn.execute(text(
+            f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF page "
+            f"FOR VALUES FROM ('{start.isoformat()}') TO ('{end.isoformat()}')"
+        ))
+        if default:
+            moved += conn.execute(text(
+                f"WITH moved AS (DELETE FROM {DEFAULT_PARTITION} "
+                "WHERE parsed_at >= :start AND parsed_at < :end RETURNING *) "
+                "INSERT INTO page SELECT * FROM moved"
+            ), {"start": start, "end": end}).rowcount
+    if default:
+        conn.execute(text(f"ALTER TABLE page ATTACH PARTITION {DEFAULT_PARTITION} DEFAULT"))
+    return moved
+
+
+def maintain_partitions(now: datetime = None) -> dict:
+    if engine.dialect.name != "postgresql":
+        return {"created": [], "dropped": []}
+    counts = {"created": [], "dropped": []}
+    with engine.begin() as conn:
+        existing = partition_bounds(conn)
+        missing = [planned for planned in planned_partitions(now) if planned[0] not in existing]
+        if missing:
+            moved = create_partitions(conn, missing)
+            counts["created"] = [name for name, _, _ in missing]
+            if moved:
+                logger.warning("Moved %d rows out of %s; partition maintenance fell behind",
+                               moved, DEFAULT_PARTITION)
+        # Retention drops whole partitions, so there is no DELETE and nothing
+        # left for vacuum to clean up.
+        for name in expired_partitions(existing, now):
+            conn.execute(text(f"ALTER TABLE page DETACH PARTITION {name}"))
+            conn.execute(text(f"DROP TABLE {name}"))
+            counts["dropped"].append(name)
+    if counts["created"] or counts["dropped"]:
+        logger.info("Created partitions %s, dropped %s", counts["created"], counts["dropped"])
+    return counts
+
+
+def main():
+    logging.basicConfig(level=logging.INFO)
+    counts = maintain_partitions()
+    print(f"Created {len(counts['created'])} partitions, dropped {len(counts['dropped'])}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+import asyncio
+import os
+import time
+import uuid
+from collections import defaultdict, deque
+from contextlib import asynccontextmanager
+from urllib.parse import urlsplit
+
+from parser.redis_client import get_redis
+
+HOST_MAX_INFLIGHT = int(os.getenv("PARSER_HOST_MAX_INFLIGHT", "4"))
+HOST_RPS = float(os.getenv("PARSER_HOST_RPS", "2"))
+HOST_SLOT_TTL = float(os.getenv("PARSER_HOST_SLOT_TTL", "120"))
+HOST_POLL_INTERVAL = float(os.getenv("PARSER_HOST_POLL_INTERVAL", "0.05"))
+# How long a single-URL task waits for a host slot before it is deferred.
+HOST_MAX_WAIT = float(os.getenv("PARSER_HOST_MAX_WAIT", "1"))
+
+# KEYS: in-flight zset, next-allowed-at key
+# ARGV: max in flight, interval ms, slot ttl ms, slot token, reservation ms (0: none)
+# Returns {0, 0} once a slot is taken, {-1, 0} while every slot is in flight,
+# otherwise {ms to wait, the Redis time booked for the caller}. A caller that
+# has to wait books the next free time, so waiting callers are served in
+# order and one that comes back with its booking skips the rate check.
+ACQUIRE_SCRIPT = """
+local now = redis.call('TIME')
+now = tonumber(now[1]) * 1000 + math.floor(tonumber(now[2]) / 1000)
+local max_inflight = tonumber(ARGV[1])
+local interval = tonumber(ARGV[2])
+local ttl = tonumber(ARGV[3])
+local reservation = tonumber(ARGV[5])
+
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', now)
+if max_inflight > 0 and redis.call('ZCARD', KEYS[1]) >= max_inflight then
+    return {-1, 0}
+end
+
+if reservation > 0 then
+    if reservation > now then
+        return {reservation - now, reservation}
+    end
+elseif interval > 0 then
+    local next_at = tonumber(redis.call('GET', KEYS[2]) or '0')
+    if next_at > now then
+        redis.call('SET', KEYS[2], next_at + interval, 'PX', next_at + interval - now)
+        return {next_at - now, next_at}
+    end
+    redis.call('SET', KEYS[2], now + interval, 'PX', interval)
+end
+redis.call('ZADD', KEYS[1], now + ttl, ARGV[4])
+redis.call('PEXPIRE', KEYS[1], ttl)
+return {0, 0}
+"""
+
+
+def host_of(url: str) -> str:
+    return urlsplit(url).netloc.lower()
+
+
+def interleave_by_host(urls: list) -> list:
+    queues = defaultdict(deque)
+    for url in urls:
+        queues[host_of(url)].append(url)
+    ordered = []
+    while queues:
+        for host in list(queues):
+            ordered.append(queues[host].popleft())
+            if not queues[host]:
+                del queues[host]
+    return ordered
+
+
+class HostBusy(Exception):
+    def __init__(self, host: str, retry_after: float, reservation: int = None):
+        super().__init__(f"No free slot for {host}")
+        self.host = host
+        self.retry_after = retry_after
+        # Pass back to HostLimiter.slot to take the slot booked for this caller.
+        self.reservation = reservation
+
+
+class HostLimiter:
+    def __init__(self, redis, max_inflight: int = HOST_MAX_INFLIGHT, rps: float = HOST_RPS,
+                 slot_ttl: float = HOST_SLOT_TTL, poll_interval: float = HOST_POLL_INTERVAL):
+        self.redis = redis
+        self.max_inflight = max_inflight
+        self.interval_ms = int(1000 / rps) if rps > 0 else 0
+        self.slot_ttl_ms = int(slot_ttl * 1000)
+        self.poll_interval = poll_interval
+        self._acquire = redis.register_script(ACQUIRE_SCRIPT)
+
+    @asynccontextmanager
+    async def slot(self, host: str, max_wait: float = None, reservation: int = None):
+        inflight_key = f"politeness:{host}:inflight"
+        token = uuid.uuid4().hex
+        deadline = time.monotonic() + max_wait if max_wait is not None else None
+        while True:
+            wait, booked = await self._acquire(
+                keys=[inflight_key, f"politeness:{host}:next"],
+                args=[self.max_inflight, self.interval_ms, self.slot_ttl_ms, token, reservation or 0],
+            )
+            if wait == 0:
+                break
+            reservation = booked or reservation
+            delay = wait / 1000 if wait > 0 else self.poll_interval
+            if deadline is not None and time.monotonic() + delay > deadline:
+                # A booked slot says exactly when to come back; a full host
+                # gives no hint, so that retry is only pushed out by max_wait.
+                raise HostBusy(host, delay if wait > 0 else max(delay, max_wait), reservation)
+            await asyncio.sleep(delay)
+        try:
+            yield
+        finally:
+            await self.redis.zrem(inflight_key, token)
+
+
+_limiter = None
+
+
+def get_host_limiter():
+    global _limiter
+    if HOST_MAX_INFLIGHT <= 0 and HOST_RPS <= 0:
+        return None
+    redis = get_redis()
+    if _limiter is None or _limiter.redis is not redis:
+        _limiter = HostLimiter(redis)
+    return _limiter
@@ -0,0 +1,41 @@
+import asyncio
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from parser.extract import Extracted, extract_bytes, extract_page, warm_up
+
+# 0 keeps extraction inline in the event loop (the default for Celery
+# workers, which already scale by process).
+EXTRACT_WORKERS = int(os.getenv("PARSER_EXTRACT_WORKERS", "0"))
+
+_pool = None
+
+
+async def start_pool(workers: int = EXTRACT_WORKERS):
+    global _pool
+    if workers <= 0 or _pool is not None:
+        return
+    # spawn rather than fork: the parent already runs an event loop, threads
+    # and open sockets that must not leak into the children.
+    _pool = ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context("spawn"))
+    loop = asyncio.get_running_loop()
+    await asyncio.gather(*(loop.run_in_executor(_pool, warm_up) for _ in range(workers)))
+
+
+async def close_pool():
+    global _pool
+    if _pool is not None:
+        pool, _pool = _pool, None
+        await asyncio.get_running_loop().run_in_executor(None, pool.shutdown)
+
+
+async def run_extract(text: str = None, body: bytes = None, encoding: str = None, url: str = None,
+                      links: bool = False) -> Extracted:
+    if text is None:
+        func, args = extract_bytes, (body, encoding, url, links)
+    else:
+        func, args = extract_page, (text, url, links)
+    if _pool is None:
+        return func(*args)
+    return await asyncio.get_running_loop().run_in_executor(_pool, func, *args)
@@ -0,0 +1,25 @@
+import asyncio
+import os
+import redis.asyncio as redis
+
+REDIS_URL = os.getenv("REDIS_URL", "redis://redis:6379/0")
+
+_client = None
+_client_loop = None
+
+
+def get_redis() -> redis.Redis:
+    global _client, _client_loop
+    loop = asyncio.get_running_loop()
+    if _client is None or _client_loop is not loop:
+        _client = redis.from_url(REDIS_URL, decode_responses=True)
+        _client_loop = loop
+    return _client
+
+
+async def close_redis():
+    global _client, _client_loop
+    if _client is not None and _client_loop is asyncio.get_running_loop():
+        await _client.aclose()
+    _client = None
+    _client_loop = None
@@ -0,0 +1,81 @@
+"""Rebuild Page rows from stored snapshots without touching the network.
+
+    python -m parser.reextract --workers 8
+"""
+import argparse
+import logging
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from sqlmodel import select, update
+
+from parser.connection import get_session
+from parser.extract import extract_bytes
+from parser.models import Page
+from parser.snapshots import SNAPSHOT_STORE, get_snapshot_store
+
+REEXTRACT_BATCH = int(os.getenv("PARSER_REEXTRACT_BATCH", "500"))
+
+logger = logging.getLogger(__name__)
+
+
+def extract_snapshot(store_name: str, content_hash: str, url: str = None):
+    # Runs in a pool worker: only the hash goes in and the extracted values
+    # come out, the snapshot itself is read from the store here.
+    try:
+        body, encoding = get_snapshot_store(store_name).get(content_hash)
+    except FileNotFoundError:
+        return None
+    return extract_bytes(body, encoding, url)
+
+
+def reextract(workers: int = None, batch_size: int = REEXTRACT_BATCH, store_name: str = None) -> dict:
+    extract_one = partial(extract_snapshot, store_name or SNAPSHOT_STORE or "local")
+    counts = {"updated": 0, "missing": 0}
+    last_id = 0
+    with ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context("spawn")) as pool, \
+            get_session() as session:
+        while True:
+            rows = session.exec(
+                select(Page.id, Page.snapshot_hash, Page.url)
+                .where(Page.snapshot_hash.is_not(None), Page.id > last_id)
+                .order_by(Page.id)
+                .limit(batch_size)
+            ).all()
+            if not rows:
+                break
+            last_id = rows[-1][0]
+
+            # Identical pages share a snapshot, so each one is extracted once.
+            urls = {content_hash: url for _, content_hash, url in reversed(rows)}
+            extracted = dict(zip(urls, pool.map(extract_one, urls, urls.values(), chunksize=16)))
+            values = []
+            for page_id, content_hash, _ in rows:
+                page = extracted[content_hash]
+                if page is None:
+                    counts["missing"] += 1
+                    continue
+                values.append({"id": page_id, "name": page.name, "description": page.description,
+                               "extra": page.fields or None})
+            if values:
+                session.execute(update(Page), values)
+                session.commit()
+            counts["updated"] += len(values)
+            logger.info("Re-extracted %d pages so far", counts["updated"])
+    return counts
+
+
+def main(argv=None):
+    p = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    p.add_argument("--workers", type=int, default=None, help="pool size, defaults to the CPU count")
+    p.add_argument("--batch-size", type=int, default=REEXTRACT_BATCH)
+    p.add_argument("--store", default=None, help="snapshot store, defaults to PARSER_SNAPSHOT_STORE or local")
+    args = p.parse_args(argv)
+    logging.basicConfig(level=logging.INFO)
+    counts = reextract(args.workers, args.batch_size, args.store)
+    print(f"Updated {counts['updated']} pages, {counts['missing']} snapshots missing")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+import json
+import os
+import socket
+
+from aiohttp.abc import AbstractResolver
+from aiohttp.resolver import DefaultResolver
+from redis.exceptions import RedisError
+
+from parser.redis_client import get_redis
+
+# Answers are shared through Redis; the connector's own DNS cache
+# (PARSER_HTTP_DNS_CACHE_TTL) stays in front of it within each process.
+DNS_SHARED = os.getenv("PARSER_DNS_SHARED", "1") == "1"
+DNS_TTL = int(os.getenv("PARSER_DNS_TTL", "300"))
+DNS_NEGATIVE_TTL = int(os.getenv("PARSER_DNS_NEGATIVE_TTL", "60"))
+
+
+def dns_key(host: str, port: int, family: int) -> str:
+    return f"dns:{int(family)}:{host}:{port}"
+
+
+class SharedResolver(AbstractResolver):
+    def __init__(self, resolver: AbstractResolver = None):
+        self._resolver = resolver or DefaultResolver()
+
+    async def resolve(self, host: str, port: int = 0, family: socket.AddressFamily = socket.AF_INET) -> list:
+        redis = get_redis()
+        key = dns_key(host, port, family)
+        try:
+            raw = await redis.get(key)
+        except RedisError:
+            # Redis being down must not stop fetches.
+            return await self._resolver.resolve(host, port, family)
+        if raw is not None:
+            cached = json.loads(raw)
+            if "error" in cached:
+                raise OSError(cached["error"])
+            return cached["hosts"]
+
+        try:
+            hosts = await self._resolver.resolve(host, port, family)
+        except OSError as e:
+            await self._store(redis, key, {"error": str(e)}, DNS_NEGATIVE_TTL)
+            raise
+        await self._store(redis, key, {"hosts": hosts}, DNS_TTL)
+        return hosts
+
+    async def _store(self, redis, key: str, entry: dict, ttl: int):
+        try:
+            await redis.set(key, json.dumps(entry), ex=ttl)
+        except RedisError:
+            pass
+
+    async def close(self):
+        await self._resolver.close()
@@ -0,0 +1,110 @@
+import asyncio
+import json
+import os
+import time
+from collections import OrderedDict
+from urllib.parse import urlsplit
+from urllib.robotparser import RobotFileParser
+
+import aiohttp
+
+from parser.redis_client import get_redis
+
+ROBOTS = os.getenv("PARSER_ROBOTS", "1") == "1"
+USER_AGENT = os.getenv("PARSER_USER_AGENT", "celery-parser")
+ROBOTS_TTL = int(os.getenv("PARSER_ROBOTS_TTL", str(24 * 3600)))
+# Unreachable robots.txt disallows the whole site, but only for this long.
+ROBOTS_ERROR_TTL = int(os.getenv("PARSER_ROBOTS_ERROR_TTL", "600"))
+ROBOTS_CACHE_SIZE = int(os.getenv("PARSER_ROBOTS_CACHE_SIZE", "10000"))
+ROBOTS_MAX_BYTES = int(os.getenv("PARSER_ROBOTS_MAX_BYTES", str(512 * 1024)))
+ROBOTS_TIMEOUT = float(os.getenv("PARSER_ROBOTS_TIMEOUT", "5"))
+
+
+class Disallowed(Exception):
+    def __init__(self, url: str):
+        super().__init__(f"Disallowed by robots.txt: {url}")
+        self.url = url
+
+
+def robots_key(origin: str) -> str:
+    return f"robots:{origin}"
+
+
+def make_rules(entry: dict) -> RobotFileParser:
+    rules = RobotFileParser()
+    if entry["rules"] is None:
+        rules.disallow_all = not entry["allow"]
+        rules.allow_all = entry["allow"]
+    else:
+        rules.parse(entry["rules"].splitlines())
+    return rules
+
+
+class RobotsCache:
+    """robots.txt rules per origin: parsed rules in a per-process LRU in front
+    of the raw files in Redis, so each origin is fetched once per TTL across
+    all workers."""
+
+    def __init__(self, redis, size: int = ROBOTS_CACHE_SIZE):
+        self.redis = redis
+        self.size = size
+        self._rules = OrderedDict()
+        self._loading = {}
+
+    async def allowed(self, session: aiohttp.ClientSession, url: str) -> bool:
+        parts = urlsplit(url)
+        origin = f"{parts.scheme}://{parts.netloc}"
+        cached = self._rules.get(origin)
+        if cached is not None and cached[0] > time.time():
+            self._rules.move_to_end(origin)
+            return cached[1].can_fetch(USER_AGENT, url)
+
+        # Concurrent misses for one origin share a single load.
+        loading = self._loading.get(origin)
+        if loading is None:
+            loading = self._loading[origin] = asyncio.ensure_future(self._load(session, origin))
+            loading.add_done_callback(lambda _: self._loading.pop(origin, None))
+        return (await asyncio.shield(loading)).can_fetch(USER_AGENT, url)
+
+    async def _load(self, session: aiohttp.ClientSession, origin: str) -> RobotFileParser:
+        raw = await self.redis.get(robots_key(origin))
+        if raw is not None:
+            entry = json.loads(raw)
+        else:
+            entry = await self._fetch(session, origin)
+            ttl = max(1, int(entry["expires_at"] - time.time()))
+            await self.redis.set(robots_key(origin), json.dumps(entry), ex=ttl)
+        rules = make_rules(entry)
+        self._rules[origin] = (entry["expires_at"], rules)
+        self._rules.move_to_end(origin)
+        while len(self._rules) > self.size:
+            self._rules.popitem(last=False)
+        return rules
+
+    async def _fetch(self, session: aiohttp.ClientSession, origin: str) -> dict:
+        # RFC 9309: a 4xx means no rules, a 5xx or no answer means stay out.
+        try:
+            timeout = aiohttp.ClientTimeout(total=ROBOTS_TIMEOUT)
+            async with session.get(f"{origin}/robots.txt", timeout=timeout) as response:
+                if 200 <= response.status < 300:
+                    body = await response.content.read(ROBOTS_MAX_BYTES)
+                    rules = body.decode("utf-8", errors="replace")
+                    return {"rules": rules, "allow": True, "expires_at": time.time() + ROBOTS_TTL}
+                if 400 <= response.status < 500 and response.status != 429:
+                    return {"rules": None, "allow": True, "expires_at": time.time() + ROBOTS_TTL}
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            pass
+        return {"rules": None, "allow": False, "expires_at": time.time() + ROBOTS_ERROR_TTL}
+
+
+_robots = None
+
+
+def get_robots():
+    global _robots
+    if not ROBOTS:
+        return None
+    redis = get_redis()
+    if _robots is None or _robots.redis is not redis:
+        _robots = RobotsCache(redis)
+    return _robots
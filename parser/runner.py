@@ -0,0 +1,52 @@
+import asyncio
+import os
+import threading
+
+MAX_INFLIGHT = int(os.getenv("PARSER_MAX_INFLIGHT", "64"))
+
+_loop = None
+_thread = None
+_semaphore = None
+_lock = threading.Lock()
+
+
+def get_loop() -> asyncio.AbstractEventLoop:
+    global _loop, _thread
+    with _lock:
+        if _loop is None or _loop.is_closed():
+            _loop = asyncio.new_event_loop()
+            _thread = threading.Thread(target=_loop.run_forever, name="parser-loop", daemon=True)
+            _thread.start()
+    return _loop
+
+
+async def _limited(coro):
+    global _semaphore
+    if _semaphore is None:
+        _semaphore = asyncio.Semaphore(MAX_INFLIGHT)
+    async with _semaphore:
+        return await coro
+
+
+def run(coro, timeout: float = None):
+    future = asyncio.run_coroutine_threadsafe(_limited(coro), get_loop())
+    try:
+        return future.result(timeout)
+    except BaseException:
+        future.cancel()
+        raise
+
+
+def shutdown(*cleanups):
+    global _loop, _thread, _semaphore
+    with _lock:
+        loop, thread = _loop, _thread
+        _loop, _thread, _semaphore = None, None, None
+    if loop is None or loop.is_closed():
+        return
+    for cleanup in cleanups:
+        asyncio.run_coroutine_threadsafe(cleanup(), loop).result()
+    asyncio.run_coroutine_threadsafe(loop.shutdown_asyncgens(), loop).result()
+    loop.call_soon_threadsafe(loop.stop)
+    thread.join()
+    loop.close()
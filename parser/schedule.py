@@ -0,0 +1,57 @@
+import os
+from datetime import datetime, timedelta
+
+MIN_REVISIT_INTERVAL = float(os.getenv("PARSER_MIN_REVISIT_INTERVAL", str(3600)))
+MAX_REVISIT_INTERVAL = float(os.getenv("PARSER_MAX_REVISIT_INTERVAL", str(30 * 24 * 3600)))
+DEFAULT_REVISIT_INTERVAL = float(os.getenv("PARSER_DEFAULT_REVISIT_INTERVAL", str(24 * 3600)))
+CHANGE_HISTORY = int(os.getenv("PARSER_CHANGE_HISTORY", "8"))
+# Aim for pages to have changed on about this share of visits.
+TARGET_CHANGE_RATE = float(os.getenv("PARSER_TARGET_CHANGE_RATE", "0.5"))
+SCHEDULE_PERIOD = float(os.getenv("PARSER_SCHEDULE_PERIOD", "60"))
+SCHEDULE_BATCH = int(os.getenv("PARSER_SCHEDULE_BATCH", "100"))
+SCHEDULE_MAX_BATCHES = int(os.getenv("PARSER_SCHEDULE_MAX_BATCHES", "10"))
+# How long a page handed to a worker stays out of the due set before the
+# parse writes its real next_due_at.
+SCHEDULE_LEASE = float(os.getenv("PARSER_SCHEDULE_LEASE", str(3600)))
+
+# change_history holds one bit per visit, newest in the lowest bit, below a
+# leading 1 that marks where the history starts.
+EMPTY_HISTORY = 1
+
+
+def record_visit(history: int, changed: bool) -> int:
+    history = (history or EMPTY_HISTORY) << 1 | int(changed)
+    if history.bit_length() > CHANGE_HISTORY + 1:
+        history = history & ((1 << CHANGE_HISTORY) - 1) | 1 << CHANGE_HISTORY
+    return history
+
+
+def change_rate(history: int):
+    visits = (history or EMPTY_HISTORY).bit_length() - 1
+    if visits == 0:
+        return None
+    return (bin(history).count("1") - 1) / visits
+
+
+def next_interval(interval: float, history: int) -> float:
+    rate = change_rate(history)
+    if rate is None:
+        return DEFAULT_REVISIT_INTERVAL
+    # Halve the interval for pages that change on every visit and at most
+    # double it for pages that never do.
+    factor = min(2.0, max(0.5, TARGET_CHANGE_RATE / rate)) if rate else 2.0
+    return min(MAX_REVISIT_INTERVAL, max(MIN_REVISIT_INTERVAL, (interval or DEFAULT_REVISIT_INTERVAL) * factor))
+
+
+def plan_visit(known, changed: bool, now: datetime = None) -> dict:
+    now = now or datetime.utcnow()
+    if known is None:
+        history, interval = EMPTY_HISTORY, DEFAULT_REVISIT_INTERVAL
+    else:
+        history = record_visit(known.change_history, changed)
+        interval = next_interval(known.revisit_interval, history)
+    return {
+        "change_history": history,
+        "revisit_interval": interval,
+        "next_due_at": now + timedelta(seconds=interval),
+    }
@@ -0,0 +1,75 @@
+import bisect
+import hashlib
+import os
+from functools import lru_cache
+from urllib.parse import urlsplit
+
+# 0 keeps the interactive/bulk queues; N routes every URL to one of
+# parser.0 ... parser.N-1 by its registrable domain.
+SHARDS = int(os.getenv("PARSER_SHARDS", "0"))
+SHARD_VNODES = int(os.getenv("PARSER_SHARD_VNODES", "128"))
+# Shards this worker consumes on top of its -Q queues, e.g. "0,1".
+WORKER_SHARDS = [int(shard) for shard in os.getenv("PARSER_WORKER_SHARDS", "").split(",") if shard.strip()]
+# Second-level labels that registries sell names under (example.co.uk),
+# a small stand-in for the public suffix list.
+SECOND_LEVEL_LABELS = {"ac", "co", "com", "edu", "gov", "ltd", "net", "org", "plc", "sch"}
+
+
+def shard_queue(shard: int) -> str:
+    return f"parser.{shard}"
+
+
+SHARD_QUEUES = [shard_queue(shard) for shard in range(SHARDS)]
+
+
+@lru_cache(maxsize=65536)
+def registrable_domain(host: str) -> str:
+    labels = host.lower().rstrip(".").split(".")
+    if labels[0] == "www":
+        labels = labels[1:]
+    if len(labels) > 2 and len(labels[-1]) == 2 and labels[-2] in SECOND_LEVEL_LABELS:
+        return ".".join(labels[-3:])
+    return ".".join(labels[-2:])
+
+
+def ring_hash(key: str) -> int:
+    return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), "big")
+
+
+class HashRing:
+    """Consistent hashing, so changing the shard count only moves the keys
+    that land on the added or removed shard."""
+
+    def __init__(self, shards: int, vnodes: int = SHARD_VNODES):
+        points = sorted((ring_hash(f"{shard}:{i}"), shard) for shard in range(shards) for i in range(vnodes))
+        self.hashes = [h for h, _ in points]
+        self.shards = [shard for _, shard in points]
+
+    def shard(self, key: str) -> int:
+        i = bisect.bisect(self.hashes, ring_hash(key))
+        return self.shards[i % len(self.shards)]
+
+
+_ring = None
+
+
+def get_ring() -> HashRing:
+    global _ring
+    if _ring is None:
+        _ring = HashRing(SHARDS)
+    return _ring
+
+
+def queue_for_url(url: str):
+    if SHARDS <= 0:
+        return None
+    return shard_queue(get_ring().shard(registrable_domain(urlsplit(url).hostname or "")))
+
+
+def split_by_shard(urls: list) -> list:
+    if SHARDS <= 0:
+        return [urls] if urls else []
+    groups = {}
+    for url in urls:
+        groups.setdefault(queue_for_url(url), []).append(url)
+    return list(groups.values())
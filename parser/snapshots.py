@@ -0,0 +1,86 @@
+import asyncio
+import os
+import tempfile
+from abc import ABC, abstractmethod
+
+# "" disables snapshots; "local" keeps them under SNAPSHOT_DIR.
+SNAPSHOT_STORE = os.getenv("PARSER_SNAPSHOT_STORE", "")
+SNAPSHOT_DIR = os.getenv("PARSER_SNAPSHOT_DIR", "/snapshots")
+SNAPSHOT_LEVEL = int(os.getenv("PARSER_SNAPSHOT_LEVEL", "3"))
+
+
+class SnapshotStore(ABC):
+    @abstractmethod
+    def exists(self, content_hash: str) -> bool:
+        """Whether a body with this hash is stored."""
+
+    @abstractmethod
+    def put(self, content_hash: str, body: bytes, encoding: str = None):
+        """Stores the raw body and the charset it was served with."""
+
+    @abstractmethod
+    def get(self, content_hash: str):
+        """(body, encoding) stored under the hash."""
+
+
+class LocalSnapshotStore(SnapshotStore):
+    """zstd-compressed files named by the SHA-256 of the uncompressed body."""
+
+    def __init__(self, root: str = SNAPSHOT_DIR, level: int = SNAPSHOT_LEVEL):
+        import zstandard
+
+        self.root = root
+        self._compressor = zstandard.ZstdCompressor(level=level)
+        self._decompressor = zstandard.ZstdDecompressor()
+
+    def path(self, content_hash: str) -> str:
+        return os.path.join(self.root, content_hash[:2], content_hash[2:4], f"{content_hash}.zst")
+
+    def exists(self, content_hash: str) -> bool:
+        return os.path.exists(self.path(content_hash))
+
+    def put(self, content_hash: str, body: bytes, encoding: str = None):
+        path = self.path(content_hash)
+        if os.path.exists(path):
+            return
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # The charset travels with the bytes so a snapshot decodes the same
+        # way the original response did.
+        data = self._compressor.compress((encoding or "").encode() + b"\n" + body)
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path))
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp, path)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+
+    def get(self, content_hash: str):
+        with open(self.path(content_hash), "rb") as f:
+            encoding, _, body = self._decompressor.decompress(f.read()).partition(b"\n")
+        return body, encoding.decode() or None
+
+
+SNAPSHOT_STORES = {
+    "local": LocalSnapshotStore,
+}
+
+_store = None
+
+
+def get_snapshot_store(name: str = None) -> SnapshotStore:
+    global _store
+    name = name if name is not None else SNAPSHOT_STORE
+    if not name:
+        return None
+    if name not in SNAPSHOT_STORES:
+        raise ValueError(f"Unknown snapshot store: {name}")
+    if _store is None:
+        _store = SNAPSHOT_STORES[name]()
+    return _store
+
+
+async def save_snapshot(store: SnapshotStore, content_hash: str, body: bytes, encoding: str = None):
+    # Compression and file IO stay off the event loop.
+    await asyncio.to_thread(store.put, content_hash, body, encoding)
@@ -1,32 +1,442 @@
 import asyncio
+import codecs
+import hashlib
+import logging
+import os
+import re
+import time
+import uuid
+from contextlib import nullcontext
+from datetime import datetime, timedelta
+from typing import NamedTuple, Optional
 import aiohttp
-from bs4 import BeautifulSoup
+from celery.exceptions import SoftTimeLimitExceeded
+from celery.signals import before_task_publish, task_prerun, worker_init, worker_process_shutdown, worker_shutdown
+from sqlmodel import select, update
 
-from parser.celery_worker import celery_app
-from parser.connection import get_session
+from parser import runner
+from parser.admission import Rejected, check_queue, completed_queue, record_completed
+from parser import crawl
+from parser.celery_worker import BULK, INTERACTIVE, celery_app, route
+from parser.breaker import breaker
+from parser.cache import set_cached
+from parser.dedupe import claim_many, release
+from parser.connection import get_async_session, close_async_engine
+from parser.extract import FieldParser, get_field_table
+from parser.metrics import (
+    FETCHED_BYTES, PAGES, QUEUE_WAIT_SECONDS, mark_process_dead, record_error, start_metrics_server, timed,
+)
+from parser.http_client import (
+    HTTP_RETRIES, RETRYABLE_ERRORS, RETRYABLE_STATUSES, RetryableStatus,
+    backoff, get_http_session, close_http_session,
+)
 from parser.models import Page
+from parser.partitions import maintain_partitions
+from parser.pool import run_extract
+from parser.politeness import HOST_MAX_WAIT, HostBusy, get_host_limiter, host_of, interleave_by_host
+from parser.redis_client import get_redis, close_redis
+from parser.robots import Disallowed, get_robots
+from parser.schedule import SCHEDULE_BATCH, SCHEDULE_LEASE, SCHEDULE_MAX_BATCHES, plan_visit
+from parser.sharding import split_by_shard
+from parser.snapshots import get_snapshot_store, save_snapshot
+from parser.urls import normalize_url
+from parser.writer import PageWriter, get_writer, close_writer, write_pages
 
+BATCH_CONCURRENCY = int(os.getenv("PARSER_BATCH_CONCURRENCY", "20"))
+# Bulk batches share the worker's event loop and connection pool with
+# interactive tasks, so they get fewer concurrent fetches.
+BULK_BATCH_CONCURRENCY = int(os.getenv("PARSER_BULK_BATCH_CONCURRENCY", "8"))
+STREAM_HEAD = os.getenv("PARSER_STREAM_HEAD", "1") == "1"
+STREAM_CHUNK_SIZE = int(os.getenv("PARSER_STREAM_CHUNK_SIZE", "16384"))
+HEAD_END_RE = re.compile(r"</head\s*>|<body[\s>]", re.IGNORECASE)
+MAX_BYTES = int(os.getenv("PARSER_MAX_BYTES", str(2 * 1024 * 1024)))
+TASK_SOFT_TIME_LIMIT = float(os.getenv("PARSER_TASK_SOFT_TIME_LIMIT", "60"))
+TASK_TIME_LIMIT = float(os.getenv("PARSER_TASK_TIME_LIMIT", "90"))
+BATCH_SOFT_TIME_LIMIT = float(os.getenv("PARSER_BATCH_SOFT_TIME_LIMIT", "600"))
+BATCH_TIME_LIMIT = float(os.getenv("PARSER_BATCH_TIME_LIMIT", "660"))
 
-@celery_app.task
-def parse_and_save_task(url: str):
-    asyncio.run(parse(url))
+logger = logging.getLogger(__name__)
 
 
-async def parse(url: str):
-    async with aiohttp.ClientSession() as session:
-        async with session.get(url) as response:
-            html = await response.text()
+@celery_app.task(bind=True, soft_time_limit=TASK_SOFT_TIME_LIMIT, time_limit=TASK_TIME_LIMIT)
+def parse_and_save_task(self, url: str, host_reservation: int = None):
+    deferred = False
+    try:
+        runner.run(parse_buffered(url, host_reservation), timeout=TASK_SOFT_TIME_LIMIT)
+    except HostBusy as e:
+        # Hand the worker and loop slots back rather than hold them while one
+        # busy host drains, and come back when the slot booked for this URL
+        # is due; the dedupe claim stays with the retried task.
+        deferred = True
+        raise self.retry(kwargs={"host_reservation": e.reservation}, countdown=e.retry_after, max_retries=None)
+    except (SoftTimeLimitExceeded, TimeoutError) as e:
+        logger.warning("Parsing %s exceeded the %ss time limit", url, TASK_SOFT_TIME_LIMIT)
+        record_error("task", e)
+        raise
+    except Exception as e:
+        record_error("task", e)
+        raise
+    finally:
+        if not deferred:
+            finish_task(self.request, [url])
 
-    soup = BeautifulSoup(html, "html.parser")
 
-    name = soup.title.string.strip() if soup.title else "No name"
+@celery_app.task(bind=True, soft_time_limit=BATCH_SOFT_TIME_LIMIT, time_limit=BATCH_TIME_LIMIT)
+def parse_batch_task(self, urls: list, priority: str = BULK):
+    concurrency = BATCH_CONCURRENCY if priority == INTERACTIVE else BULK_BATCH_CONCURRENCY
+    try:
+        return runner.run(parse_many(urls, concurrency), timeout=BATCH_SOFT_TIME_LIMIT)
+    except (SoftTimeLimitExceeded, TimeoutError):
+        logger.warning("Batch of %d URLs exceeded the %ss time limit", len(urls), BATCH_SOFT_TIME_LIMIT)
+        raise
+    finally:
+        finish_task(self.request, urls)
 
-    description = "No description"
-    meta_tag = soup.find("meta", attrs={"name": "description"})
-    if meta_tag and meta_tag.get("content"):
-        description = meta_tag["content"].strip()
 
-    with get_session() as session:
-        page = Page(name=name, description=description)
-        session.merge(page)
-        session.commit()
+@celery_app.task(bind=True, soft_time_limit=BATCH_SOFT_TIME_LIMIT, time_limit=BATCH_TIME_LIMIT)
+def crawl_task(self, crawl_id: str, seed: str = None):
+    # Each run handles one frontier batch and re-enqueues itself, so a large
+    # site never holds a worker for longer than a batch.
+    if runner.run(crawl_batch(crawl_id), timeout=BATCH_SOFT_TIME_LIMIT):
+        crawl_task.apply_async(args=[crawl_id, seed], **route(BULK, seed))
+
+
+@celery_app.task(name="tasks.schedule_due_task")
+def schedule_due_task():
+    return runner.run(schedule_due(), timeout=BATCH_SOFT_TIME_LIMIT)
+
+
+@celery_app.task(name="tasks.maintain_partitions_task")
+def maintain_partitions_task():
+    return maintain_partitions()
+
+
+async def schedule_due(now: datetime = None) -> int:
+    redis = get_redis()
+    try:
+        await check_queue(redis, BULK)
+    except Rejected as e:
+        logger.info("Skipping revisits this round: %s", e.reason)
+        return 0
+
+    now = now or datetime.utcnow()
+    async with get_async_session() as session:
+        urls = (await session.exec(
+            select(Page.url)
+            .where(Page.next_due_at <= now)
+            .order_by(Page.next_due_at)
+            .limit(SCHEDULE_BATCH * SCHEDULE_MAX_BATCHES)
+        )).all()
+        if not urls:
+            return 0
+        # Lease the rows so the next tick does not pick them up again before
+        # the parse writes their real next_due_at.
+        await session.execute(
+            update(Page).where(Page.url.in_(urls)).values(next_due_at=now + timedelta(seconds=SCHEDULE_LEASE))
+        )
+        await session.commit()
+
+    for group in split_by_shard(urls):
+        for i in range(0, len(group), SCHEDULE_BATCH):
+            task_id = uuid.uuid4().hex
+            claimed = await claim_many(redis, group[i:i + SCHEDULE_BATCH], task_id)
+            batch = [url for url, (_, created) in claimed.items() if created]
+            if batch:
+                parse_batch_task.apply_async(args=[batch, BULK], task_id=task_id, **route(BULK, batch[0]))
+    return len(urls)
+
+
+async def parse_buffered(url: str, host_reservation: int = None) -> dict:
+    # The shared writer starts its flush task on the running loop, so it has
+    # to be created there rather than in the calling worker thread.
+    return await parse(url, writer=get_writer(), max_host_wait=HOST_MAX_WAIT, host_reservation=host_reservation)
+
+
+def finish_task(request, urls: list):
+    async def run():
+        redis = get_redis()
+        await release(redis, urls, request.id)
+        await record_completed(redis, completed_queue(request.delivery_info or {}))
+
+    try:
+        runner.run(run())
+    except Exception as e:
+        logger.warning("Failed to release in-flight claims for task %s: %s", request.id, e)
+
+
+@worker_init.connect
+def serve_metrics(**kwargs):
+    start_metrics_server()
+
+
+@worker_process_shutdown.connect
+@worker_shutdown.connect
+def close_worker_loop(**kwargs):
+    runner.shutdown(close_writer, close_http_session, close_redis, close_async_engine)
+    mark_process_dead(os.getpid())
+
+
+@before_task_publish.connect
+def stamp_enqueued_at(headers=None, **kwargs):
+    if headers is not None:
+        headers.setdefault("enqueued_at", time.time())
+
+
+@task_prerun.connect
+def observe_queue_wait(task=None, **kwargs):
+    enqueued_at = getattr(task.request, "enqueued_at", None)
+    if enqueued_at is not None:
+        QUEUE_WAIT_SECONDS.observe(max(0.0, time.time() - enqueued_at))
+
+
+async def parse(url: str, session: aiohttp.ClientSession = None, writer: PageWriter = None,
+                follow: bool = False, max_host_wait: float = None, host_reservation: int = None) -> dict:
+    url = normalize_url(url)
+    known = await load_page(url)
+    headers = {}
+    # Following links needs the body even when the page has not changed.
+    if known is not None and known.etag and not follow:
+        headers["If-None-Match"] = known.etag
+    if known is not None and known.last_modified and not follow:
+        headers["If-Modified-Since"] = known.last_modified
+
+    session = session or get_http_session()
+    robots = get_robots()
+    if robots is not None and not await robots.allowed(session, url):
+        PAGES.labels("disallowed").inc()
+        raise Disallowed(url)
+
+    fetched = await fetch_with_retry(session, url, headers, full=follow, max_host_wait=max_host_wait,
+                                     host_reservation=host_reservation)
+
+    unchanged = known is not None and (fetched.status == 304 or fetched.content_hash == known.content_hash)
+    visit = plan_visit(known, changed=not unchanged)
+    if unchanged and not follow:
+        PAGES.labels("unchanged").inc()
+        if writer is not None:
+            await writer.touch(url, visit)
+        else:
+            await write_pages([], [{"url": url, **visit}])
+        return await cache_result(url, known.name, known.description, datetime.utcnow(), known.extra)
+
+    with timed("extract"):
+        extracted = await run_extract(fetched.text, fetched.body, fetched.encoding, url, links=follow)
+    name, description = extracted.name, extracted.description
+    PAGES.labels("unchanged" if unchanged else "changed").inc()
+    page = Page(
+        url=url,
+        name=name,
+        description=description,
+        etag=fetched.etag,
+        last_modified=fetched.last_modified,
+        content_hash=fetched.content_hash,
+        snapshot_hash=await snapshot(url, fetched),
+        extra=extracted.fields or None,
+        **visit,
+    )
+    if writer is not None:
+        await writer.add(page)
+    else:
+        await write_pages([page], [])
+    result = await cache_result(url, name, description, page.parsed_at, page.extra)
+    if follow:
+        result["links"] = extracted.links
+    return result
+
+
+async def snapshot(url: str, fetched: "FetchResult") -> Optional[str]:
+    store = get_snapshot_store()
+    if store is None or fetched.body is None:
+        return None
+    try:
+        with timed("snapshot"):
+            await save_snapshot(store, fetched.content_hash, fetched.body, fetched.encoding)
+    except Exception as e:
+        logger.warning("Failed to snapshot %s: %s", url, e)
+        record_error("snapshot", e)
+        return None
+    return fetched.content_hash
+
+
+async def cache_result(url: str, name: str, description: str, parsed_at: datetime, extra: dict = None) -> dict:
+    result = {"url": url, "name": name, "description": description, "parsed_at": parsed_at.isoformat(),
+              "extra": extra}
+    try:
+        await set_cached(get_redis(), url, name, description, result["parsed_at"], extra)
+    except Exception as e:
+        logger.warning("Failed to cache %s: %s", url, e)
+    return result
+
+
+async def parse_many(urls: list, concurrency: int = BATCH_CONCURRENCY):
+    semaphore = asyncio.Semaphore(concurrency)
+    failed = set()
+    writer = PageWriter(on_failed=lambda urls: failed.update(normalize_url(url) for url in urls))
+
+    async def parse_one(session, url):
+        async with semaphore:
+            try:
+                await parse(url, session, writer)
+            except Exception as e:
+                record_error("parse", e)
+                return {"url": url, "ok": False, "error": str(e)}
+            return {"url": url, "ok": True, "error": None}
+
+    session = get_http_session()
+    results = await asyncio.gather(*(parse_one(session, url) for url in interleave_by_host(urls)))
+    await writer.flush()
+    for result in results:
+        if normalize_url(result["url"]) in failed:
+            result.update(ok=False, error="Failed to persist")
+    by_url = {result["url"]: result for result in results}
+    return [by_url[url] for url in urls]
+
+
+async def crawl_batch(crawl_id: str, concurrency: int = BULK_BATCH_CONCURRENCY) -> bool:
+    redis = get_redis()
+    meta = await crawl.crawl_meta(redis, crawl_id)
+    if meta is None:
+        return False
+    semaphore = asyncio.Semaphore(concurrency)
+    failed = set()
+    writer = PageWriter(on_failed=lambda urls: failed.update(normalize_url(url) for url in urls))
+    session = get_http_session()
+
+    async def visit(entry):
+        async with semaphore:
+            try:
+                if entry["sitemap"]:
+                    fetched = await fetch_with_retry(session, entry["url"], full=True)
+                    pages, sitemaps = crawl.parse_sitemap(fetched.body)
+                    # Normalized like discovered links, so the Bloom filter
+                    # sees one key per page, and kept to the crawl's sites.
+                    sitemaps = crawl.same_site_links(entry["url"], sitemaps, meta["sites"])
+                    pages = crawl.same_site_links(entry["url"], pages, meta["sites"])
+                    await crawl.push(redis, crawl_id, sitemaps, 0, sitemap=True)
+                    await crawl.push(redis, crawl_id, pages, 0)
+                    return
+                result = await parse(entry["url"], session, writer, follow=True)
+            except Exception as e:
+                logger.warning("Crawl %s failed to fetch %s: %s", crawl_id, entry["url"], e)
+                record_error("crawl", e)
+                await crawl.count(redis, crawl_id, "failed")
+                return
+            await crawl.count(redis, crawl_id, "parsed")
+            if entry["depth"] < meta["max_depth"]:
+                links = crawl.same_site_links(result["url"], result["links"], meta["sites"])
+                await crawl.push(redis, crawl_id, links, entry["depth"] + 1)
+
+    entries = await crawl.pop(redis, crawl_id)
+    await asyncio.gather(*(visit(entry) for entry in entries))
+    await writer.flush()
+    return bool(entries)
+
+
+class FetchResult(NamedTuple):
+    status: int
+    text: str
+    content_hash: Optional[str]
+    etag: Optional[str]
+    last_modified: Optional[str]
+    body: Optional[bytes] = None
+    encoding: Optional[str] = None
+
+
+async def fetch_with_retry(session: aiohttp.ClientSession, url: str, headers: dict = None,
+                           full: bool = False, max_host_wait: float = None,
+                           host_reservation: int = None) -> FetchResult:
+    host = host_of(url)
+    breaker.check(host)
+    limiter = get_host_limiter()
+    for attempt in range(HTTP_RETRIES + 1):
+        try:
+            slot = limiter.slot(host, max_host_wait, host_reservation) if limiter is not None else nullcontext()
+            host_reservation = None
+            async with slot:
+                fetched = await fetch(session, url, headers, full)
+            if fetched.status in RETRYABLE_STATUSES:
+                raise RetryableStatus(fetched.status)
+        except (RetryableStatus, *RETRYABLE_ERRORS) as e:
+            if attempt == HTTP_RETRIES:
+                breaker.record_failure(host)
+                record_error("fetch", e)
+                raise
+            await asyncio.sleep(backoff(attempt))
+            continue
+        breaker.record_success(host)
+        return fetched
+
+
+async def fetch(session: aiohttp.ClientSession, url: str, headers: dict = None, full: bool = False) -> FetchResult:
+    with timed("download"):
+        return await _fetch(session, url, headers, full)
+
+
+async def _fetch(session: aiohttp.ClientSession, url: str, headers: dict = None, full: bool = False) -> FetchResult:
+    async with session.get(url, headers=headers) as response:
+        etag = response.headers.get("ETag")
+        last_modified = response.headers.get("Last-Modified")
+        if response.status == 304 or response.status in RETRYABLE_STATUSES:
+            return FetchResult(response.status, "", None, etag, last_modified)
+        # A snapshot has to hold the whole page for reextract, so streaming
+        # stops being worth it once a snapshot store is configured.
+        if STREAM_HEAD and not full and get_snapshot_store() is None:
+            text, content_hash = await read_head(response)
+            return FetchResult(response.status, text, content_hash, etag, last_modified)
+        # Decoding is left to the extractor so only raw bytes cross into
+        # the extraction pool.
+        body = await read_body(response)
+        return FetchResult(response.status, None, hashlib.sha256(body).hexdigest(), etag, last_modified,
+                           body, response.charset)
+
+
+async def read_body(response) -> bytes:
+    chunks = []
+    size = 0
+    async for chunk in response.content.iter_chunked(STREAM_CHUNK_SIZE):
+        chunk = chunk[:MAX_BYTES - size]
+        size += len(chunk)
+        chunks.append(chunk)
+        if size >= MAX_BYTES:
+            response.close()
+            break
+    FETCHED_BYTES.inc(size)
+    return b"".join(chunks)
+
+
+async def read_head(response):
+    try:
+        decoder = codecs.getincrementaldecoder(response.charset or "utf-8")(errors="replace")
+    except LookupError:
+        decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+
+    # Stops at </head> unless an enabled field needs the body, in which case
+    # there is no point scanning for it while streaming.
+    table = get_field_table()
+    head = FieldParser(table) if not table.needs_body else None
+    parts = []
+    size = 0
+    async for chunk in response.content.iter_chunked(STREAM_CHUNK_SIZE):
+        chunk = chunk[:MAX_BYTES - size]
+        size += len(chunk)
+        text = decoder.decode(chunk)
+        parts.append(text)
+        if head is not None:
+            head.feed(text)
+        if (head is not None and head.done) or size >= MAX_BYTES:
+            response.close()
+            break
+    parts.append(decoder.decode(b"", final=True))
+    FETCHED_BYTES.inc(size)
+    text = "".join(parts)
+    # How far past </head> the last chunk reaches depends on how the response
+    # happened to arrive, so the text and its hash end with the head.
+    end = HEAD_END_RE.search(text) if head is not None and head.done else None
+    if end is not None:
+        text = text[:end.end()]
+    return text, hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+async def load_page(url: str) -> Optional[Page]:
+    async with get_async_session() as session:
+        return (await session.exec(select(Page).where(Page.url == url))).first()
@@ -0,0 +1,193 @@
+import asyncio
+import logging
+import os
+import time
+from datetime import datetime
+from typing import Callable
+from sqlalchemy import bindparam, text
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlmodel import select
+
+from parser.connection import engine, get_async_session
+from parser.metrics import record_error, timed
+from parser.models import Page
+
+WRITER_BATCH_SIZE = int(os.getenv("PARSER_WRITER_BATCH_SIZE", "500"))
+WRITER_FLUSH_INTERVAL = float(os.getenv("PARSER_WRITER_FLUSH_INTERVAL", "2"))
+
+logger = logging.getLogger(__name__)
+
+
+def insert(table):
+    if engine.dialect.name == "postgresql":
+        return postgresql.insert(table)
+    return sqlite.insert(table)
+
+
+def page_row(page: Page) -> dict:
+    return {column.name: getattr(page, column.name) for column in Page.__table__.columns}
+
+
+def page_rows(pages: list) -> list:
+    rows = {}
+    for page in pages:
+        row = page_row(page)
+        del row["id"]
+        rows[row["url"]] = row
+    return list(rows.values())
+
+
+def upsert_pages(pages: list):
+    rows = page_rows(pages)
+    statement = insert(Page).values(rows)
+    return statement.on_conflict_do_update(
+        index_elements=["url"],
+        set_={name: statement.excluded[name] for name in rows[0] if name != "url"},
+    )
+
+
+async def write_pages(pages: list, touched: list):
+    with timed("db"):
+        await _write_pages(pages, touched)
+
+
+async def upsert_partitioned(session, pages: list):
+    # On Postgres page is partitioned by parsed_at, and a unique index there
+    # would have to include parsed_at, so ON CONFLICT (url) has nothing to
+    # match. Writers of the same URL take a transaction-level advisory lock
+    # instead, in url order so two batches cannot deadlock.
+    rows = page_rows(pages)
+    urls = sorted(row["url"] for row in rows)
+    await session.execute(
+        text("SELECT pg_advisory_xact_lock(hashtextextended(url, 0)) "
+             "FROM unnest(CAST(:urls AS text[])) AS url ORDER BY url"),
+        {"urls": urls},
+    )
+    existing = set((await session.exec(select(Page.url).where(Page.url.in_(urls)))).all())
+    inserts = [row for row in rows if row["url"] not in existing]
+    if inserts:
+        await session.execute(insert(Page).values(inserts))
+    for statement, params in update_statements([row for row in rows if row["url"] in existing]):
+        await session.execute(statement, params)
+
+
+def update_statements(touched: list):
+    """Groups rows ({"url": ..., column: value}) into one executemany UPDATE per column set."""
+    now = datetime.utcnow()
+    groups = {}
+    for row in touched:
+        row = {"parsed_at": now, **row}
+        groups.setdefault(tuple(sorted(row)), []).append({f"b_{k}": v for k, v in row.items()})
+    table = Page.__table__
+    for columns, params in groups.items():
+        statement = table.update().where(table.c.url == bindparam("b_url")).values(
+            {name: bindparam(f"b_{name}") for name in columns if name != "url"}
+        )
+        yield statement, params
+
+
+async def _write_pages(pages: list, touched: list):
+    async with get_async_session() as session:
+        if pages and engine.dialect.name == "postgresql":
+            await upsert_partitioned(session, pages)
+        elif pages:
+            await session.execute(upsert_pages(pages))
+        for statement, params in update_statements(touched):
+            await session.execute(statement, params)
+        await session.commit()
+
+
+class PageWriter:
+    def __init__(self, batch_size: int = WRITER_BATCH_SIZE, flush_interval: float = WRITER_FLUSH_INTERVAL,
+                 on_failed: Callable = None):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        # Called with the URLs of every flush that failed to persist them,
+        # including flushes nobody awaits (size and interval triggered ones).
+        self.on_failed = on_failed
+        self._pages = []
+        self._touched = []
+        self._first_at = None
+        self._task = None
+
+    def __len__(self):
+        return len(self._pages) + len(self._touched)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._flush_periodically())
+
+    async def add(self, page: Page):
+        self._pages.append(page)
+        await self._buffered()
+
+    async def touch(self, url: str, values: dict = None):
+        self._touched.append({"url": url, **(values or {})})
+        await self._buffered()
+
+    async def flush(self) -> list:
+        pages, touched = self._pages, self._touched
+        self._pages, self._touched, self._first_at = [], [], None
+        if not pages and not touched:
+            return []
+
+        try:
+            await write_pages(pages, touched)
+            return []
+        except Exception as e:
+            logger.warning("Bulk write of %d pages failed, retrying one by one: %s", len(pages), e)
+
+        failed = []
+        if touched:
+            try:
+                await write_pages([], touched)
+            except Exception as e:
+                logger.error("Failed to bump parsed_at for %d pages: %s", len(touched), e)
+                record_error("db", e)
+                failed.extend(row["url"] for row in touched)
+        for page in pages:
+            try:
+                await write_pages([page], [])
+            except Exception as e:
+                logger.error("Failed to persist %s: %s", page.url, e)
+                record_error("db", e)
+                failed.append(page.url)
+        if failed and self.on_failed is not None:
+            self.on_failed(failed)
+        return failed
+
+    async def close(self) -> list:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        return await self.flush()
+
+    async def _buffered(self):
+        if self._first_at is None:
+            self._first_at = time.monotonic()
+        if len(self) >= self.batch_size or time.monotonic() - self._first_at >= self.flush_interval:
+            await self.flush()
+
+    async def _flush_periodically(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            if len(self):
+                await self.flush()
+
+
+_writer = None
+
+
+def get_writer() -> PageWriter:
+    global _writer
+    if _writer is None:
+        _writer = PageWriter()
+        _writer.start()
+    return _writer
+
+
+async def close_writer():
+    global _writer
+    if _writer is not None:
+        await _writer.close()
+        _writer = None
@@ -0,0 +1,272 @@
+"""End-to-end throughput benchmark for the parser pipeline.
+
+Serves synthetic pages from a local aiohttp server (in a child process) and
+drives parse(), parse_and_save_task and parse_batch_task against it:
+
+    python -m tests.benchmark --pages 2000 --size 200000 --latency 0.02 --out bench.json
+    python -m tests.benchmark --pages 2000 --size 200000 --latency 0.02 --compare bench.json
+
+Results (pages/sec, p50/p99 latency, peak RSS) are written as JSON so runs
+from different commits can be compared; --compare exits with status 1 when a
+scenario regressed by more than --threshold.
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+SCENARIOS = ("parse", "task", "batch")
+
+
+def parse_args(argv=None):
+    p = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    p.add_argument("--pages", type=int, default=500, help="pages per scenario")
+    p.add_argument("--size", type=int, default=100_000, help="total page size in bytes")
+    p.add_argument("--head-size", type=int, default=2_000, help="size of <head> in bytes")
+    p.add_argument("--latency", type=float, default=0.0, help="server latency per response in seconds")
+    p.add_argument("--concurrency", type=int, default=32)
+    p.add_argument("--batch-size", type=int, default=100)
+    p.add_argument("--scenarios", default=",".join(SCENARIOS))
+    p.add_argument("--db", default=None, help="DB_ADMIN url, defaults to a temporary SQLite file")
+    p.add_argument("--out", default=None, help="write results to this JSON file")
+    p.add_argument("--compare", default=None, help="baseline JSON file to compare against")
+    p.add_argument("--threshold", type=float, default=0.10, help="allowed relative regression")
+    return p.parse_args(argv)
+
+
+def configure_env(args):
+    # Must happen before the parser modules are imported: they read their
+    # configuration at import time.
+    db = args.db or os.getenv("DB_ADMIN") or f"sqlite:///{tempfile.mkdtemp()}/bench.db"
+    os.environ["DB_ADMIN"] = db
+    os.environ.setdefault("DB_ECHO", "0")
+    os.environ.setdefault("PARSER_HOST_MAX_INFLIGHT", "0")
+    os.environ.setdefault("PARSER_HOST_RPS", "0")
+    os.environ.setdefault("PARSER_HTTP_LIMIT", str(args.concurrency * 2))
+    os.environ.setdefault("PARSER_HTTP_LIMIT_PER_HOST", str(args.concurrency * 2))
+    os.environ.setdefault("PARSER_MAX_INFLIGHT", str(args.concurrency))
+    os.environ.setdefault("PARSER_BATCH_CONCURRENCY", str(args.concurrency))
+    os.environ.setdefault("PARSER_BULK_BATCH_CONCURRENCY", str(args.concurrency))
+
+
+def synthetic_page(n: int, size: int, head_size: int) -> bytes:
+    head = f"<head><title>Page {n}</title><meta name=\"description\" content=\"Synthetic page {n}\">"
+    filler = "<meta name=\"x\" content=\"filler\">"
+    head += filler * max(0, (head_size - len(head)) // len(filler)) + "</head>"
+    body = "<body>"
+    paragraph = f"<p>Paragraph of page {n} <a href=\"/page/{n + 1}\">next</a></p>"
+    body += paragraph * max(0, (size - len(head) - len(body)) // len(paragraph)) + "</body>"
+    return f"<!doctype html><html>{head}{body}</html>".encode()
+
+
+def serve(size, head_size, latency, ready):
+    from aiohttp import web
+
+    async def page(request):
+        if latency:
+            await asyncio.sleep(latency)
+        body = synthetic_page(int(request.match_info["n"]), size, head_size)
+        return web.Response(body=body, content_type="text/html", charset="utf-8")
+
+    async def main():
+        app = web.Application()
+        app.router.add_get("/page/{n}", page)
+        runner = web.AppRunner(app, access_log=None)
+        await runner.setup()
+        site = web.TCPSite(runner, "127.0.0.1", 0)
+        await site.start()
+        ready.put(site._server.sockets[0].getsockname()[1])
+        await asyncio.Event().wait()
+
+    asyncio.run(main())
+
+
+def start_server(args):
+    ready = multiprocessing.Queue()
+    process = multiprocessing.Process(
+        target=serve, args=(args.size, args.head_size, args.latency, ready), daemon=True)
+    process.start()
+    return process, f"http://127.0.0.1:{ready.get(timeout=30)}"
+
+
+def use_local_redis():
+    from parser import redis_client
+
+    try:
+        import redis
+        redis.Redis.from_url(redis_client.REDIS_URL, socket_connect_timeout=1).ping()
+        return redis_client.REDIS_URL
+    except Exception:
+        pass
+    try:
+        import fakeredis
+    except ImportError:
+        sys.exit(f"Redis at {redis_client.REDIS_URL} is unreachable; set REDIS_URL or install fakeredis")
+
+    server = fakeredis.FakeServer()
+
+    class FakeRedisModule:
+        @staticmethod
+        def from_url(url, **kwargs):
+            return fakeredis.FakeAsyncRedis(server=server, **kwargs)
+
+    redis_client.redis = FakeRedisModule
+    return "fakeredis"
+
+
+def summarize(latencies, started, finished, pages, errors):
+    seconds = finished - started
+    quantiles = statistics.quantiles(latencies, n=100) if len(latencies) > 1 else latencies * 99
+    return {
+        "pages": pages,
+        "errors": errors,
+        "seconds": round(seconds, 3),
+        "pages_per_sec": round(pages / seconds, 2) if seconds else 0.0,
+        "p50_ms": round(statistics.median(latencies) * 1000, 2),
+        "p99_ms": round(quantiles[98] * 1000, 2),
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+    }
+
+
+def bench_parse(urls, args):
+    from parser import runner, tasks
+
+    async def run():
+        semaphore = asyncio.Semaphore(args.concurrency)
+        latencies = []
+        errors = 0
+
+        async def one(url):
+            nonlocal errors
+            async with semaphore:
+                started = time.perf_counter()
+                try:
+                    await tasks.parse(url)
+                except Exception:
+                    errors += 1
+                latencies.append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(one(url) for url in urls))
+        return summarize(latencies, started, time.perf_counter(), len(urls), errors)
+
+    return runner.run(run())
+
+
+def bench_task(urls, args):
+    from parser import runner, tasks, writer
+
+    def one(url):
+        started = time.perf_counter()
+        result = tasks.parse_and_save_task.apply(args=[url])
+        return time.perf_counter() - started, result.failed()
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(args.concurrency) as pool:
+        outcomes = list(pool.map(one, urls))
+    runner.run(writer.close_writer())
+    return summarize([o[0] for o in outcomes], started, time.perf_counter(), len(urls),
+                     sum(o[1] for o in outcomes))
+
+
+def bench_batch(urls, args):
+    from parser import tasks
+
+    batches = [urls[i:i + args.batch_size] for i in range(0, len(urls), args.batch_size)]
+
+    def one(batch):
+        started = time.perf_counter()
+        result = tasks.parse_batch_task.apply(args=[batch])
+        failed = len(batch) if result.failed() else sum(not r["ok"] for r in result.result)
+        return time.perf_counter() - started, failed
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max(1, args.concurrency // args.batch_size)) as pool:
+        outcomes = list(pool.map(one, batches))
+    return summarize([o[0] for o in outcomes], started, time.perf_counter(), len(urls),
+                     sum(o[1] for o in outcomes))
+
+
+BENCHMARKS = {"parse": bench_parse, "task": bench_task, "batch": bench_batch}
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True).strip()
+    except Exception:
+        return None
+
+
+def compare(results, baseline, threshold):
+    regressions = []
+    for name, current in results.items():
+        before = baseline.get("results", {}).get(name)
+        if before is None:
+            continue
+        if current["pages_per_sec"] < before["pages_per_sec"] * (1 - threshold):
+            regressions.append(f"{name}: pages/sec {before['pages_per_sec']} -> {current['pages_per_sec']}")
+        if current["p99_ms"] > before["p99_ms"] * (1 + threshold):
+            regressions.append(f"{name}: p99 {before['p99_ms']}ms -> {current['p99_ms']}ms")
+    return regressions
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    configure_env(args)
+
+    from parser import runner, tasks  # noqa: F401 registers the models before init_db
+    from parser.celery_worker import celery_app
+    from parser.connection import init_db, close_async_engine
+    from parser.http_client import close_http_session
+    from parser.redis_client import close_redis
+
+    redis_url = use_local_redis()
+    init_db()
+    # Bind the task proxies before worker threads race to evaluate them.
+    celery_app.finalize(auto=True)
+    server, base_url = start_server(args)
+    results = {}
+    try:
+        for n, name in enumerate(s for s in args.scenarios.split(",") if s):
+            offset = n * args.pages
+            urls = [f"{base_url}/page/{offset + i}" for i in range(args.pages)]
+            results[name] = BENCHMARKS[name](urls, args)
+            print(f"{name:>6}: {json.dumps(results[name])}")
+    finally:
+        runner.shutdown(close_http_session, close_redis, close_async_engine)
+        server.terminate()
+
+    report = {
+        "meta": {
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "db": os.environ["DB_ADMIN"].split("://", 1)[0],
+            "redis": redis_url,
+            "args": {k: v for k, v in vars(args).items() if k not in ("out", "compare")},
+        },
+        "results": results,
+    }
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(results, json.load(f), args.threshold)
+        for line in regressions:
+            print(f"REGRESSION {line}")
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
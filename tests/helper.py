@@ -1,9 +1,10 @@
 import aiohttp
 import asyncio
-from contextlib import contextmanager
+import itertools
+from contextlib import asynccontextmanager
 
-from parser import connection as conn_mod
 from parser import tasks as tasks_module
+from parser import writer as writer_module
 
 
 class SQLModelBase:
@@ -71,9 +72,39 @@ class BeautifulSoupStub:
         return None
 
 
+class FakeStreamReader:
+    """Yields chunks of up to n bytes, cycling through ``chunk_sizes`` like a
+    socket that hands over whatever has arrived."""
+
+    def __init__(self, data, chunk_sizes=(1.0, 0.3, 0.7)):
+        self._data = data
+        self.chunk_sizes = chunk_sizes
+        self.read_bytes = 0
+
+    async def iter_chunked(self, n):
+        i = 0
+        for share in itertools.cycle(self.chunk_sizes):
+            if i >= len(self._data):
+                break
+            chunk = self._data[i:i + max(1, int(n * share))]
+            i += len(chunk)
+            self.read_bytes += len(chunk)
+            yield chunk
+
+    async def read(self, n=-1):
+        data = self._data if n < 0 else self._data[:n]
+        self.read_bytes += len(data)
+        return data
+
+
 class FakeRespCtx:
-    def __init__(self, html):
+    def __init__(self, html, status=200, headers=None, chunk_sizes=(1.0, 0.3, 0.7)):
         self._html = html
+        self.status = status
+        self.headers = headers or {}
+        self.charset = "utf-8"
+        self.content = FakeStreamReader(html.encode("utf-8"), chunk_sizes)
+        self.closed = False
 
     async def __aenter__(self):
         return self
@@ -84,10 +115,17 @@ class FakeRespCtx:
     async def text(self):
         return self._html
 
+    async def read(self):
+        return self._html.encode("utf-8")
+
+    def close(self):
+        self.closed = True
+
 
 class FakeClientSession:
     def __init__(self, html):
         self.html = html
+        self.requested = []
 
     async def __aenter__(self):
         return self
@@ -95,56 +133,200 @@ class FakeClientSession:
     async def __aexit__(self, exc_type, exc, tb):
         return False
 
-    def get(self, url):
-        return FakeRespCtx(self.html)
+    def get(self, url, headers=None, timeout=None):
+        self.requested.append((url, headers))
+        html = self.html.get(url) if isinstance(self.html, dict) else self.html
+        if isinstance(html, Exception):
+            raise html
+        if isinstance(html, FakeRespCtx):
+            return html
+        return FakeRespCtx(html)
+
+
+class FakeResult:
+    def __init__(self, rows):
+        self._rows = rows
+
+    def first(self):
+        return self._rows[0] if self._rows else None
+
+    def all(self):
+        return list(self._rows)
 
 
 class FakeDBSession:
-    def __init__(self):
-        self.merged = []
+    def __init__(self, pages=None):
+        self.pages = pages or []
+        self.executed = []
         self.committed = False
 
-    def merge(self, obj):
-        self.merged.append(obj)
-        return obj
+    async def exec(self, statement):
+        return FakeResult(self.pages)
+
+    async def execute(self, statement, params=None):
+        self.executed.append(statement)
+        return FakeResult([])
 
-    def commit(self):
+    async def commit(self):
         self.committed = True
 
 
-@contextmanager
-def fake_get_session():
+class FakeConnection:
+    """Sync connection answering each statement from ``rows`` by its first word."""
+
+    def __init__(self, rows=None):
+        self.rows = rows or {}
+        self.executed = []
+
+    def execute(self, statement, params=None):
+        sql = str(statement)
+        self.executed.append(sql)
+        result = FakeResult(self.rows.get(sql.split()[0], []))
+        result.rowcount = len(result._rows)
+        return result
+
+
+@asynccontextmanager
+async def fake_get_session():
     s = FakeDBSession()
     yield s
 
 
-def run_parse_and_capture(html):
-    original_cs = aiohttp.ClientSession
-    original_get_session = conn_mod.get_session
+class FakeWriteLog:
+    def __init__(self):
+        self.written = []
+        self.touched = []
+        self.committed = False
+        self.requested = []
 
-    last = {}
+    async def write_pages(self, pages, touched):
+        self.written.extend(pages)
+        self.touched.extend(touched)
+        self.committed = True
 
-    def capturing_get_session():
-        s = FakeDBSession()
-        last['session'] = s
 
-        @contextmanager
-        def cm():
-            yield s
+def run_parse_and_capture(html, known=None):
+    original_get_http_session = tasks_module.get_http_session
+    original_get_host_limiter = tasks_module.get_host_limiter
+    original_get_robots = tasks_module.get_robots
+    original_get_redis = tasks_module.get_redis
+    original_get_session = tasks_module.get_async_session
+    original_write_pages = tasks_module.write_pages
 
-        return cm()
+    log = FakeWriteLog()
+    client = FakeClientSession(html)
 
-    aiohttp.ClientSession = lambda: FakeClientSession(html)
-    conn_mod.get_session = capturing_get_session
+    @asynccontextmanager
+    async def lookup_session():
+        yield FakeDBSession([known] if known is not None else None)
 
-    try:
-        tasks_module.get_session = capturing_get_session
-    except Exception:
-        pass
+    tasks_module.get_http_session = lambda: client
+    tasks_module.get_host_limiter = lambda: None
+    tasks_module.get_robots = lambda: None
+    tasks_module.get_redis = lambda: FakeRedis()
+    tasks_module.get_async_session = lookup_session
+    tasks_module.write_pages = log.write_pages
 
     try:
         asyncio.run(tasks_module.parse("http://example.test"))
-        return last.get('session')
+        log.requested = client.requested
+        return log
     finally:
-        aiohttp.ClientSession = original_cs
-        conn_mod.get_session = original_get_session
+        tasks_module.get_http_session = original_get_http_session
+        tasks_module.get_host_limiter = original_get_host_limiter
+        tasks_module.get_robots = original_get_robots
+        tasks_module.get_redis = original_get_redis
+        tasks_module.get_async_session = original_get_session
+        tasks_module.write_pages = original_write_pages
+
+
+def run_parse_many_and_capture(pages, fail_urls=()):
+    original_get_http_session = tasks_module.get_http_session
+    original_get_host_limiter = tasks_module.get_host_limiter
+    original_get_robots = tasks_module.get_robots
+    original_get_redis = tasks_module.get_redis
+    original_get_session = tasks_module.get_async_session
+    original_write_pages = writer_module.write_pages
+
+    sessions = []
+    written = []
+
+    def make_client_session():
+        s = FakeClientSession(pages)
+        sessions.append(s)
+        return s
+
+    async def recording_write_pages(batch, touched):
+        if any(page.url in fail_urls for page in batch):
+            raise RuntimeError("write failed")
+        written.extend(batch)
+
+    tasks_module.get_http_session = make_client_session
+    tasks_module.get_host_limiter = lambda: None
+    tasks_module.get_robots = lambda: None
+    tasks_module.get_redis = lambda: FakeRedis()
+    tasks_module.get_async_session = fake_get_session
+    writer_module.write_pages = recording_write_pages
+
+    try:
+        results = asyncio.run(tasks_module.parse_many(list(pages)))
+        return results, sessions, written
+    finally:
+        tasks_module.get_http_session = original_get_http_session
+        tasks_module.get_host_limiter = original_get_host_limiter
+        tasks_module.get_robots = original_get_robots
+        tasks_module.get_redis = original_get_redis
+        tasks_module.get_async_session = original_get_session
+        writer_module.write_pages = original_write_pages
+
+
+class FakePipeline:
+    def __init__(self, redis):
+        self._redis = redis
+        self._calls = []
+
+    def __getattr__(self, name):
+        def queue(*args, **kwargs):
+            self._calls.append((name, args, kwargs))
+            return self
+        return queue
+
+    async def execute(self):
+        calls, self._calls = self._calls, []
+        return [await getattr(self._redis, name)(*args, **kwargs) for name, args, kwargs in calls]
+
+
+class FakeRedis:
+    def __init__(self):
+        self.data = {}
+
+    def pipeline(self, transaction=True):
+        return FakePipeline(self)
+
+    async def set(self, key, value, nx=False, ex=None):
+        if nx and key in self.data:
+            return None
+        self.data[key] = value
+        return True
+
+    async def get(self, key):
+        return self.data.get(key)
+
+    async def delete(self, *keys):
+        return sum(self.data.pop(key, None) is not None for key in keys)
+
+    async def llen(self, key):
+        return len(self.data.get(key, []))
+
+    async def incrby(self, key, amount=1):
+        self.data[key] = int(self.data.get(key, 0)) + amount
+        return self.data[key]
+
+    async def incr(self, key):
+        return await self.incrby(key)
+
+    async def decrby(self, key, amount=1):
+        return await self.incrby(key, -amount)
+
+    async def expire(self, key, seconds):
+        return key in self.data
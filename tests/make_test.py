@@ -1,7 +1,16 @@
+import json
 import sys
+import time
 import types
 
+import pytest
+
 import parser.main as main_module
+from parser import extract as extract_module
+from parser import http_client
+from parser import politeness
+from parser import runner
+from parser import writer as writer_module
 
 from tests.helper import *
 
@@ -28,8 +37,8 @@ def test_parse_extracts_title_and_description():
     session = run_parse_and_capture(html)
     assert session is not None
     assert session.committed is True
-    assert len(session.merged) == 1
-    page = session.merged[0]
+    assert len(session.written) == 1
+    page = session.written[0]
     assert hasattr(page, "name")
     assert page.name == "Test Page"
     assert page.description == "A nice description"
@@ -40,7 +49,7 @@ def test_parse_no_title_no_description():
     session = run_parse_and_capture(html)
     assert session is not None
     assert session.committed is True
-    page = session.merged[0]
+    page = session.written[0]
     assert page.name == "No name"
     assert page.description == "No description"
 
@@ -48,22 +57,1090 @@ def test_parse_no_title_no_description():
 def test_parse_meta_without_content():
     html = "<html><head><title>Title</title><meta name='description' content=''/></head></html>"
     session = run_parse_and_capture(html)
-    page = session.merged[0]
+    page = session.written[0]
     assert page.description == "No description"
 
 
 def test_parse_strips_whitespace():
     html = "<html><head><title>   My Title   </title><meta name='description' content='   desc   '/></head></html>"
     session = run_parse_and_capture(html)
-    page = session.merged[0]
+    page = session.written[0]
     assert page.name == "My Title"
     assert page.description == "desc"
 
 
 def test_main_parse_endpoint_calls_parse():
     called = {}
+    main_module.get_redis = lambda: FakeRedis()
     tasks_module.parse_and_save_task = types.SimpleNamespace(apply_async=lambda *a, **k: called.update({'args': a, 'kwargs': k}))
     main_module.parse_and_save_task = tasks_module.parse_and_save_task
     result = asyncio.run(main_module.parse_endpoint("http://x"))
-    assert result == {"message": "Task started"}
+    assert result == {"message": "Task started", "task_id": called['kwargs']['task_id']}
     assert 'args' in called
+
+
+def test_parse_many_reports_per_url_results():
+    pages = {
+        "http://a.test/": "<html><head><title>A</title></head></html>",
+        "http://b.test/": aiohttp.ClientError("boom"),
+        "http://c.test/": "<html><head><title>C</title></head></html>",
+    }
+    results, sessions, merged = run_parse_many_and_capture(pages)
+    assert len(sessions) == 1
+    assert [r["url"] for r in results] == list(pages)
+    assert [r["ok"] for r in results] == [True, False, True]
+    assert results[1]["error"] == "boom"
+    assert sorted(p.name for p in merged) == ["A", "C"]
+
+
+def test_main_parse_batch_celery_endpoint_enqueues_one_task():
+    called = {}
+    main_module.get_redis = lambda: FakeRedis()
+    main_module.parse_batch_task = types.SimpleNamespace(
+        apply_async=lambda *a, **k: called.update({'args': a, 'kwargs': k})
+    )
+    data = main_module.ParseBatchRequest(urls=["http://x", "http://y"])
+    result = asyncio.run(main_module.parse_batch_celery_endpoint(data))
+    assert result == {"message": "Task started", "task_id": called['kwargs']['task_id'], "attached": {}}
+    assert called['kwargs']['args'] == [["http://x", "http://y"], "bulk"]
+    assert (called['kwargs']['queue'], called['kwargs']['priority']) == ("parser.bulk", 6)
+
+
+def test_http_session_is_reused_within_a_loop():
+    async def run():
+        first = http_client.get_http_session()
+        second = http_client.get_http_session()
+        limit_per_host = first.connector.limit_per_host
+        await http_client.close_http_session()
+        return first, second, limit_per_host
+
+    first, second, limit_per_host = asyncio.run(run())
+    assert first is second
+    assert first.closed
+    assert limit_per_host == http_client.HTTP_LIMIT_PER_HOST
+
+
+def test_read_head_stops_after_head():
+    html = "<html><head><title>T</title></head><body>" + "x" * 100000 + "</body></html>"
+    response = FakeRespCtx(html)
+    text, _ = asyncio.run(tasks_module.read_head(response))
+    assert response.closed
+    assert response.content.read_bytes < 100000
+    assert extract_module.extract(text) == ("T", "No description")
+
+
+def test_read_head_enforces_byte_cap():
+    html = "<html><head><title>T</title>" + "<script>x</script>" * 100000
+    response = FakeRespCtx(html)
+    original = tasks_module.MAX_BYTES
+    tasks_module.MAX_BYTES = 50000
+    try:
+        text, _ = asyncio.run(tasks_module.read_head(response))
+    finally:
+        tasks_module.MAX_BYTES = original
+    assert response.closed
+    assert len(text) == 50000
+
+
+EXTRACT_CASES = [
+    ("<html><head><title>  Test Page  </title><meta name='description' content=' A nice description '/></head><body></body></html>",
+     ("Test Page", "A nice description")),
+    ("<html><head></head><body>No title here</body></html>", ("No name", "No description")),
+    ("<html><head><title>Title</title><meta name='description' content=''/></head></html>", ("Title", "No description")),
+    ("<html><head><title>   My Title   </title><meta name='description' content='   desc   '/></head></html>",
+     ("My Title", "desc")),
+    ("<html><head><title>A &amp; B</title><meta name='description' content='x &lt; y'></head></html>",
+     ("A & B", "x < y")),
+    ("<html><head><meta name='description' content='first'><meta name='description' content='second'></head>"
+     "<body><title>Late</title></body></html>", ("Late", "first")),
+    ("<?xml version=\"1.0\" encoding=\"UTF-8\"?>\n<html xmlns=\"http://www.w3.org/1999/xhtml\"><head>"
+     "<title>Caf\u00e9</title><meta name=\"description\" content=\"XHTML\" /></head><body></body></html>",
+     ("Caf\u00e9", "XHTML")),
+    ("<html><head></head><body>" + "x" * 10000 + "<title>Late</title><meta name='description' content='late'>"
+     "</body></html>", ("Late", "late")),
+]
+
+
+@pytest.mark.parametrize("backend", sorted(extract_module.EXTRACTORS))
+@pytest.mark.parametrize("html,expected", EXTRACT_CASES)
+def test_extractor_backends_agree(backend, html, expected):
+    if backend == "lxml":
+        pytest.importorskip("lxml")
+    assert extract_module.get_extractor(backend).extract(html) == expected
+    page = extract_module.get_extractor(backend).extract_page(html)
+    assert (page.name, page.description) == expected
+
+
+FIELDS_HTML = (
+    "<!doctype html><html lang='en'><head><title>T</title>"
+    "<meta property='og:title' content=' OG title '><meta property='og:image' content='/i.png'>"
+    "<link rel='alternate' href='/feed'><link rel='Canonical' href='http://a.test/c'></head>"
+    "<body><h1>Hello <b>world</b></h1><h1>Second</h1>"
+    "<a href='/local'>l</a><a href='http://a.test/x'>s</a><a href='https://b.test/'>o</a>"
+    "<a href='//c.test/'>o</a><a href='mailto:x@b.test'>m</a></body></html>"
+)
+
+
+@pytest.mark.parametrize("backend", sorted(extract_module.EXTRACTORS))
+def test_extractor_backends_fill_registered_fields(backend):
+    if backend == "lxml":
+        pytest.importorskip("lxml")
+    page = extract_module.get_extractor(backend).extract_page(
+        FIELDS_HTML, "http://a.test/", extract_module.get_field_table(list(extract_module.FIELDS)))
+    assert page.name == "T"
+    assert page.fields == {
+        "og_title": "OG title",
+        "og_image": "/i.png",
+        "canonical": "http://a.test/c",
+        "lang": "en",
+        "h1": "Hello world",
+        "outbound_links": 2,
+    }
+
+
+def test_parse_stores_registered_fields_on_page(monkeypatch):
+    monkeypatch.setattr(extract_module, "ENABLED_FIELDS", list(extract_module.FIELDS))
+    log = run_parse_and_capture(FIELDS_HTML)
+    extra = log.written[0].extra
+    assert (extra["og_title"], extra["h1"]) == ("OG title", "Hello world")
+
+
+def test_default_fields_stay_in_head():
+    assert not extract_module.get_field_table().needs_body
+
+
+def test_head_only_fields_stop_at_head():
+    table = extract_module.get_field_table(["og_title", "lang"])
+    parser = extract_module.FieldParser(table)
+    parser.feed(FIELDS_HTML[:FIELDS_HTML.index("<body>") + 6])
+    assert parser.done
+    assert not extract_module.FieldParser(extract_module.get_field_table(["h1"])).done
+
+
+def test_read_head_reads_body_when_a_field_needs_it(monkeypatch):
+    monkeypatch.setattr(extract_module, "ENABLED_FIELDS", ["h1"])
+    response = FakeRespCtx("<html><head><title>T</title></head><body>" + "x" * 100000 + "<h1>H</h1></body></html>")
+    text, _ = asyncio.run(tasks_module.read_head(response))
+    assert text.endswith("<h1>H</h1></body></html>")
+
+
+def test_full_fetch_is_capped_at_max_bytes(monkeypatch):
+    monkeypatch.setattr(tasks_module, "MAX_BYTES", 1000)
+    monkeypatch.setattr(tasks_module, "STREAM_CHUNK_SIZE", 300)
+    response = FakeRespCtx("<html><head><title>Big</title></head><body>" + "x" * 10000)
+    fetched = asyncio.run(tasks_module._fetch(FakeClientSession(response), "http://a.test/", full=True))
+    assert len(fetched.body) == 1000 and fetched.body.startswith(b"<html>")
+    assert response.closed
+
+
+def test_extract_pool_decodes_and_extracts_raw_bytes():
+    from parser import pool
+
+    html = "<html><head><title>Caf\u00e9</title><meta name='description' content='D'></head></html>"
+
+    async def run():
+        await pool.start_pool(1)
+        try:
+            return await pool.run_extract(body=html.encode("latin-1"), encoding="latin-1")
+        finally:
+            await pool.close_pool()
+
+    assert asyncio.run(run())[:2] == ("Caf\u00e9", "D")
+    assert pool._pool is None
+
+
+def test_parse_sends_validators_and_skips_on_304():
+    known = tasks_module.Page(id=7, url="http://example.test/", name="Old", etag='"abc"',
+                              last_modified="Mon, 01 Jan 2024 00:00:00 GMT", content_hash="h")
+    session = run_parse_and_capture(FakeRespCtx("", status=304), known=known)
+    assert session.requested == [("http://example.test/", {
+        "If-None-Match": '"abc"',
+        "If-Modified-Since": "Mon, 01 Jan 2024 00:00:00 GMT",
+    })]
+    assert session.written == []
+    assert [row["url"] for row in session.touched] == ["http://example.test/"]
+
+
+def test_parse_skips_unchanged_body():
+    html = "<html><head><title>Same</title></head></html>"
+    content_hash = asyncio.run(tasks_module.fetch(FakeClientSession(html), "http://example.test/")).content_hash
+    known = tasks_module.Page(id=7, url="http://example.test/", name="Same", content_hash=content_hash)
+    session = run_parse_and_capture(html, known=known)
+    assert session.written == []
+    assert [row["url"] for row in session.touched] == ["http://example.test/"]
+
+
+def test_head_hash_does_not_depend_on_chunking():
+    html = "<html><head><title>Same</title></head><body>" + "x" * 50000 + "</body></html>"
+    hashes = set()
+    for chunk_sizes in [(1.0,), (0.01,), (0.003, 0.5)]:
+        response = FakeRespCtx(html, chunk_sizes=chunk_sizes)
+        text, content_hash = asyncio.run(tasks_module.read_head(response))
+        assert response.closed and text.endswith("</head>")
+        hashes.add(content_hash)
+    assert len(hashes) == 1
+
+
+def test_parse_updates_known_page_when_changed():
+    html = "<html><head><title>New</title></head></html>"
+    known = tasks_module.Page(id=7, url="http://example.test/", name="Old", content_hash="stale")
+    session = run_parse_and_capture(FakeRespCtx(html, headers={"ETag": '"v2"'}), known=known)
+    page = session.written[0]
+    assert (page.url, page.name, page.etag) == ("http://example.test/", "New", '"v2"')
+    assert page.content_hash != "stale"
+
+
+def test_revisit_interval_follows_change_rate():
+    from datetime import datetime
+    from parser import schedule
+
+    history = schedule.EMPTY_HISTORY
+    for changed in [True] * 4:
+        history = schedule.record_visit(history, changed)
+    assert schedule.change_rate(history) == 1
+    assert schedule.next_interval(86400, history) == 43200
+
+    for _ in range(20):
+        history = schedule.record_visit(history, False)
+    assert history.bit_length() == schedule.CHANGE_HISTORY + 1 and schedule.change_rate(history) == 0
+    assert schedule.next_interval(20 * 86400, history) == schedule.MAX_REVISIT_INTERVAL
+    assert schedule.next_interval(3600, schedule.record_visit(history, True)) == 7200
+
+    visit = schedule.plan_visit(None, True, now=datetime(2026, 1, 1))
+    assert visit["next_due_at"] == datetime(2026, 1, 2)
+
+
+def test_schedule_due_leases_and_enqueues_bulk_batches(monkeypatch):
+    from parser import admission
+
+    redis = FakeRedis()
+    session = FakeDBSession(pages=[f"http://a.test/{i}" for i in range(5)])
+    calls = []
+
+    @asynccontextmanager
+    async def get_session():
+        yield session
+
+    monkeypatch.setattr(admission, "DEPTH_CACHE_TTL", 0)
+    monkeypatch.setattr(tasks_module, "get_redis", lambda: redis)
+    monkeypatch.setattr(tasks_module, "get_async_session", get_session)
+    monkeypatch.setattr(tasks_module, "SCHEDULE_BATCH", 2)
+    monkeypatch.setattr(tasks_module, "parse_batch_task",
+                        types.SimpleNamespace(apply_async=lambda args, **k: calls.append((args, k))))
+
+    assert asyncio.run(tasks_module.schedule_due()) == 5
+    assert len(session.executed) == 1 and session.committed
+    assert [args[0] for args, _ in calls] == [session.pages[:2], session.pages[2:4], session.pages[4:]]
+    assert {(args[1], k["queue"]) for args, k in calls} == {("bulk", "parser.bulk")}
+
+    # Already claimed URLs are not enqueued twice.
+    calls.clear()
+    asyncio.run(tasks_module.schedule_due())
+    assert calls == []
+
+    monkeypatch.setitem(admission.MAX_QUEUE_DEPTH, "bulk", 1)
+    redis.data["parser.bulk"] = [0]
+    assert asyncio.run(tasks_module.schedule_due()) == 0
+
+
+def test_beat_schedule_names_registered_tasks():
+    schedule = tasks_module.celery_app.conf.beat_schedule
+    assert schedule
+    for entry in schedule.values():
+        assert entry["task"] in tasks_module.celery_app.tasks
+        assert entry["task"] in tasks_module.celery_app.conf.task_routes
+
+
+def test_parse_many_reports_pages_that_failed_to_persist():
+    pages = {
+        "http://a.test/": "<html><head><title>A</title></head></html>",
+        "http://b.test/": "<html><head><title>B</title></head></html>",
+    }
+    results, _, written = run_parse_many_and_capture(pages, fail_urls={"http://b.test/"})
+    assert [p.name for p in written] == ["A"]
+    assert [(r["ok"], r["error"]) for r in results] == [(True, None), (False, "Failed to persist")]
+
+
+def test_parse_many_reports_failures_from_mid_batch_flushes(monkeypatch):
+    monkeypatch.setattr(tasks_module, "PageWriter", lambda **kwargs: writer_module.PageWriter(batch_size=1, **kwargs))
+    pages = {
+        "http://a.test/": "<html><head><title>A</title></head></html>",
+        "http://b.test/": "<html><head><title>B</title></head></html>",
+    }
+    results, _, written = run_parse_many_and_capture(pages, fail_urls={"http://a.test/"})
+    assert [p.name for p in written] == ["B"]
+    assert [(r["url"], r["ok"]) for r in results] == [("http://a.test/", False), ("http://b.test/", True)]
+
+
+def test_page_writer_reports_failed_touches_without_keeping_them(monkeypatch):
+    async def failing_write_pages(pages, touched):
+        raise RuntimeError("write failed")
+
+    monkeypatch.setattr(writer_module, "write_pages", failing_write_pages)
+    reported = []
+    writer = writer_module.PageWriter(batch_size=1, on_failed=reported.append)
+    asyncio.run(writer.touch("http://a.test/"))
+    assert reported == [["http://a.test/"]]
+    assert not hasattr(writer, "failed")
+
+
+def test_page_writer_flushes_by_size_in_bulk_statements():
+    session = FakeDBSession()
+
+    @asynccontextmanager
+    async def get_async_session():
+        yield session
+
+    original = writer_module.get_async_session
+    writer_module.get_async_session = get_async_session
+    try:
+        writer = writer_module.PageWriter(batch_size=3, flush_interval=60)
+
+        async def run():
+            await writer.add(tasks_module.Page(url="http://a.test", name="A"))
+            await writer.touch("http://c.test/")
+            assert session.executed == []
+            await writer.add(tasks_module.Page(url="http://b.test", name="B"))
+
+        asyncio.run(run())
+    finally:
+        writer_module.get_async_session = original
+    assert len(writer) == 0
+    assert len(session.executed) == 2
+    assert session.committed is True
+
+
+def test_normalize_url():
+    from parser.urls import normalize_url
+    assert normalize_url("HTTP://Example.COM") == "http://example.com/"
+    assert normalize_url("https://example.com:443/a?b=1#top") == "https://example.com/a?b=1"
+    assert normalize_url("http://example.com:8080/a") == "http://example.com:8080/a"
+
+
+def test_upsert_pages_is_one_statement_keyed_by_url():
+    statement = writer_module.upsert_pages([
+        tasks_module.Page(url="http://a.test/", name="Old"),
+        tasks_module.Page(url="http://a.test/", name="New"),
+        tasks_module.Page(url="http://b.test/", name="B"),
+    ])
+    sql = str(statement.compile(dialect=writer_module.engine.dialect))
+    assert "ON CONFLICT (url) DO UPDATE" in sql
+    params = statement.compile().params
+    assert params["name_m0"] == "New"
+    assert "name_m2" not in params
+
+
+def test_partitioned_upsert_locks_urls_then_inserts_or_updates():
+    session = FakeDBSession(pages=["http://a.test/"])
+    asyncio.run(writer_module.upsert_partitioned(session, [
+        tasks_module.Page(url="http://b.test/", name="B"),
+        tasks_module.Page(url="http://a.test/", name="A"),
+    ]))
+    lock, inserted, updated = session.executed
+    assert "pg_advisory_xact_lock" in str(lock)
+    assert inserted.compile().params["url_m0"] == "http://b.test/"
+    assert str(updated).startswith("UPDATE page SET") and "WHERE page.url = :b_url" in str(updated)
+
+
+def test_partitions_are_planned_ahead_and_expire_whole(monkeypatch):
+    from datetime import date, datetime
+    from parser import partitions
+
+    monkeypatch.setattr(partitions, "PARTITION_DAYS", 7)
+    planned = partitions.planned_partitions(datetime(2026, 10, 18, 12), ahead=2)
+    assert [name for name, _, _ in planned] == ["page_p20261012", "page_p20261019", "page_p20261026"]
+    assert planned[0][1:] == (date(2026, 10, 12), date(2026, 10, 19))
+
+    bounds = {
+        "page_history": partitions.parse_bound("FOR VALUES FROM (MINVALUE) TO ('2026-07-06 00:00:00')"),
+        "page_p20260706": partitions.parse_bound("FOR VALUES FROM ('2026-07-06 00:00:00') TO ('2026-07-13 00:00:00')"),
+        "page_p20261012": partitions.parse_bound("FOR VALUES FROM ('2026-10-12 00:00:00') TO ('2026-10-19 00:00:00')"),
+    }
+    assert partitions.parse_bound("DEFAULT") is None
+    now = datetime(2026, 10, 18)
+    assert partitions.expired_partitions(bounds, now, retention_days=90) == ["page_history", "page_p20260706"]
+    assert partitions.expired_partitions(bounds, now, retention_days=0) == []
+
+
+def test_partitions_move_rows_out_of_the_default_partition(monkeypatch):
+    from contextlib import contextmanager
+    from datetime import datetime
+    from parser import partitions
+
+    conn = FakeConnection({
+        "SELECT": [("page_default", "DEFAULT")],
+        "WITH": [(1,), (2,)],
+    })
+
+    @contextmanager
+    def begin():
+        yield conn
+
+    monkeypatch.setattr(partitions, "PARTITION_DAYS", 7)
+    monkeypatch.setattr(partitions, "engine", types.SimpleNamespace(dialect=types.SimpleNamespace(name="postgresql"),
+                                                                    begin=begin))
+    counts = partitions.maintain_partitions(datetime(2026, 10, 18))
+    assert len(counts["created"]) == partitions.PARTITIONS_AHEAD + 1
+    changes = [sql for sql in conn.executed if not sql.startswith("SELECT")]
+    assert changes[0] == "ALTER TABLE page DETACH PARTITION page_default"
+    assert changes[1].startswith("CREATE TABLE IF NOT EXISTS page_p20261012 PARTITION OF page")
+    assert changes[2].startswith("WITH moved AS (DELETE FROM page_default")
+    assert changes[-1] == "ALTER TABLE page ATTACH PARTITION page_default DEFAULT"
+
+
+def test_runner_overlaps_tasks_on_one_persistent_loop():
+    import threading
+    import time
+
+    state = {"inflight": 0, "peak": 0, "loops": set()}
+
+    async def job():
+        state["loops"].add(asyncio.get_running_loop())
+        state["inflight"] += 1
+        state["peak"] = max(state["peak"], state["inflight"])
+        await asyncio.sleep(0.2)
+        state["inflight"] -= 1
+
+    original = runner.MAX_INFLIGHT
+    runner.MAX_INFLIGHT = 3
+    try:
+        started = time.monotonic()
+        threads = [threading.Thread(target=runner.run, args=(job(),)) for _ in range(6)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        elapsed = time.monotonic() - started
+    finally:
+        runner.shutdown()
+        runner.MAX_INFLIGHT = original
+    assert len(state["loops"]) == 1
+    assert state["peak"] == 3
+    assert elapsed < 1.0
+
+
+def test_parse_buffered_starts_shared_writer_on_runner_loop(monkeypatch):
+    import parser.tasks as tasks_module
+
+    writers = []
+
+    async def fake_parse(url, session=None, writer=None, **kwargs):
+        writers.append(writer)
+
+    monkeypatch.setattr(tasks_module, "parse", fake_parse)
+    try:
+        runner.run(tasks_module.parse_buffered("http://a.test/"))
+        assert writers[0] is writer_module.get_writer()
+        assert writers[0]._task is not None
+    finally:
+        runner.shutdown(writer_module.close_writer)
+
+
+def test_robots_rules_are_cached_per_origin_and_shared_through_redis():
+    import aiohttp
+    from parser import robots as robots_module
+
+    redis = FakeRedis()
+    client = FakeClientSession({
+        "http://a.test/robots.txt": "User-agent: *\nDisallow: /private\n",
+        "http://b.test/robots.txt": FakeRespCtx("", status=404),
+        "http://c.test/robots.txt": aiohttp.ClientConnectionError(),
+    })
+
+    async def run():
+        cache = robots_module.RobotsCache(redis)
+        checks = await asyncio.gather(
+            cache.allowed(client, "http://a.test/page"),
+            cache.allowed(client, "http://a.test/private/1"),
+            cache.allowed(client, "http://b.test/anything"),
+            cache.allowed(client, "http://c.test/anything"),
+        )
+        # Another process starts with an empty LRU but finds the rules in Redis.
+        other = robots_module.RobotsCache(redis)
+        checks.append(await other.allowed(client, "http://a.test/private/2"))
+        return checks
+
+    assert asyncio.run(run()) == [True, False, True, False, False]
+    assert sorted(url for url, _ in client.requested) == [
+        "http://a.test/robots.txt", "http://b.test/robots.txt", "http://c.test/robots.txt",
+    ]
+
+
+def test_parse_refuses_pages_disallowed_by_robots(monkeypatch):
+    from parser.robots import Disallowed
+
+    class Robots:
+        async def allowed(self, session, url):
+            return False
+
+    client = FakeClientSession("<html></html>")
+    monkeypatch.setattr(tasks_module, "get_robots", lambda: Robots())
+    monkeypatch.setattr(tasks_module, "get_http_session", lambda: client)
+    monkeypatch.setattr(tasks_module, "load_page", lambda url: asyncio.sleep(0))
+    with pytest.raises(Disallowed):
+        asyncio.run(tasks_module.parse("http://a.test/private"))
+    assert client.requested == []
+
+
+def test_shared_resolver_answers_from_redis_across_processes(monkeypatch):
+    from parser import resolver as resolver_module
+
+    redis = FakeRedis()
+    lookups = []
+
+    class Resolver:
+        async def resolve(self, host, port=0, family=0):
+            lookups.append(host)
+            if host == "missing.test":
+                raise OSError("Name or service not known")
+            return [{"hostname": host, "host": "10.0.0.1", "port": port, "family": 2, "proto": 0, "flags": 0}]
+
+    monkeypatch.setattr(resolver_module, "get_redis", lambda: redis)
+
+    async def run():
+        first, second = resolver_module.SharedResolver(Resolver()), resolver_module.SharedResolver(Resolver())
+        hosts = await first.resolve("a.test", 443)
+        assert await second.resolve("a.test", 443) == hosts
+        for r in (first, second):
+            with pytest.raises(OSError):
+                await r.resolve("missing.test", 443)
+
+    asyncio.run(run())
+    assert lookups == ["a.test", "missing.test"]
+
+
+def test_interleave_by_host():
+    urls = ["http://a/1", "http://a/2", "http://a/3", "http://b/1", "http://c/1", "http://b/2"]
+    assert politeness.interleave_by_host(urls) == [
+        "http://a/1", "http://b/1", "http://c/1", "http://a/2", "http://b/2", "http://a/3",
+    ]
+
+
+def test_host_limiter_caps_inflight_per_host():
+    fakeredis = pytest.importorskip("fakeredis")
+    state = {"inflight": 0, "peak": 0}
+
+    async def fetch(limiter, host):
+        async with limiter.slot(host):
+            state["inflight"] += 1
+            state["peak"] = max(state["peak"], state["inflight"])
+            await asyncio.sleep(0.05)
+            state["inflight"] -= 1
+
+    async def run():
+        redis = fakeredis.FakeAsyncRedis(decode_responses=True)
+        limiter = politeness.HostLimiter(redis, max_inflight=2, rps=0, poll_interval=0.01)
+        await asyncio.gather(*(fetch(limiter, "a.test") for _ in range(6)))
+        return await redis.zcard("politeness:a.test:inflight")
+
+    assert asyncio.run(run()) == 0
+    assert state["peak"] == 2
+
+
+def test_host_limiter_spaces_requests_by_rate():
+    fakeredis = pytest.importorskip("fakeredis")
+    import time
+
+    async def run():
+        redis = fakeredis.FakeAsyncRedis(decode_responses=True)
+        limiter = politeness.HostLimiter(redis, max_inflight=0, rps=20)
+        started = time.monotonic()
+        for _ in range(4):
+            async with limiter.slot("a.test"):
+                pass
+        async with limiter.slot("b.test"):
+            pass
+        return time.monotonic() - started
+
+    assert asyncio.run(run()) >= 0.14
+
+
+def test_single_url_task_is_deferred_instead_of_waiting_on_a_busy_host(monkeypatch):
+    fakeredis = pytest.importorskip("fakeredis")
+
+    async def busy():
+        redis = fakeredis.FakeAsyncRedis(decode_responses=True)
+        limiter = politeness.HostLimiter(redis, max_inflight=0, rps=1)
+        async with limiter.slot("a.test", max_wait=0.1):
+            pass
+        with pytest.raises(politeness.HostBusy) as raised:
+            async with limiter.slot("a.test", max_wait=0.1):
+                pass
+        return raised.value
+
+    raised = asyncio.run(busy())
+    assert 0.5 < raised.retry_after <= 1 and raised.reservation
+
+    task = tasks_module.celery_app.tasks["parser.tasks.parse_and_save_task"]
+    calls, finished = [], []
+
+    async def parse_buffered(url, host_reservation=None):
+        calls.append((url, host_reservation))
+        if len(calls) == 1:
+            raise politeness.HostBusy("a.test", 0.01, 1234)
+
+    monkeypatch.setattr(tasks_module, "parse_buffered", parse_buffered)
+    monkeypatch.setattr(tasks_module, "finish_task", lambda request, urls: finished.append(urls))
+    task.apply(args=["http://a.test/"])
+    assert calls == [("http://a.test/", None), ("http://a.test/", 1234)]
+    assert finished == [["http://a.test/"]]
+
+
+def test_deferred_urls_book_successive_host_slots():
+    fakeredis = pytest.importorskip("fakeredis")
+
+    async def run():
+        redis = fakeredis.FakeAsyncRedis(decode_responses=True)
+        limiter = politeness.HostLimiter(redis, max_inflight=0, rps=10)
+        async with limiter.slot("a.test", max_wait=0):
+            pass
+        deferred = []
+        for _ in range(4):
+            with pytest.raises(politeness.HostBusy) as raised:
+                async with limiter.slot("a.test", max_wait=0):
+                    pass
+            deferred.append(raised.value)
+        # Coming back when its slot is due takes it without waiting again.
+        await asyncio.sleep(deferred[0].retry_after)
+        async with limiter.slot("a.test", max_wait=0, reservation=deferred[0].reservation):
+            pass
+        return deferred
+
+    deferred = asyncio.run(run())
+    assert [round(busy.retry_after, 1) for busy in deferred] == [0.1, 0.2, 0.3, 0.4]
+    assert [b.reservation - a.reservation for a, b in zip(deferred, deferred[1:])] == [100, 100, 100]
+
+
+def test_parse_celery_attaches_to_inflight_task():
+    calls = []
+    redis = FakeRedis()
+    main_module.get_redis = lambda: redis
+    main_module.parse_and_save_task = types.SimpleNamespace(apply_async=lambda *a, **k: calls.append(k))
+    main_module.parse_batch_task = types.SimpleNamespace(apply_async=lambda *a, **k: calls.append(k))
+
+    first = asyncio.run(main_module.parse_endpoint("http://x"))
+    second = asyncio.run(main_module.parse_endpoint("HTTP://X/"))
+    batch = asyncio.run(main_module.parse_batch_celery_endpoint(
+        main_module.ParseBatchRequest(urls=["http://x", "http://y"])))
+
+    assert len(calls) == 2
+    assert second == {"message": "Task already queued", "task_id": first["task_id"]}
+    assert batch["attached"] == {"http://x": first["task_id"]}
+    assert calls[1]["args"] == [["http://y"], "bulk"]
+
+
+def test_claim_retries_when_the_other_claim_expires_mid_claim():
+    from parser import dedupe
+
+    class ExpiringRedis(FakeRedis):
+        async def get(self, key):
+            # The existing claim expires right after SET NX saw it.
+            self.data.pop(key, None)
+            return None
+
+    redis = ExpiringRedis()
+    redis.data[dedupe.inflight_key("http://a.test/")] = "old-task"
+    redis.data[dedupe.inflight_key("http://b.test/")] = "old-task"
+    claimed = asyncio.run(dedupe.claim_many(redis, ["http://b.test/", "http://a.test/"], "new-task"))
+    assert claimed == {"http://b.test/": ("new-task", True), "http://a.test/": ("new-task", True)}
+    assert list(claimed) == ["http://b.test/", "http://a.test/"]
+    assert redis.data[dedupe.inflight_key("http://a.test/")] == "new-task"
+
+
+def test_release_keeps_claim_for_window_only_for_owner():
+    fakeredis = pytest.importorskip("fakeredis")
+    from parser import dedupe
+
+    async def run():
+        redis = fakeredis.FakeAsyncRedis(decode_responses=True)
+        await dedupe.claim(redis, "http://a", "t1")
+        await dedupe.release(redis, ["http://a"], "other", window=0)
+        kept = await redis.get("inflight:http://a/")
+        await dedupe.release(redis, ["http://a"], "t1", window=5)
+        return kept, await redis.ttl("inflight:http://a/")
+
+    assert asyncio.run(run()) == ("t1", 5)
+
+
+def route_endpoint(path):
+    return next(r.endpoint for r in main_module.app.routes if getattr(r, "path", None) == path)
+
+
+def test_parse_endpoint_serves_fresh_cache_without_fetching(monkeypatch):
+    from parser import cache
+
+    async def fail(url):
+        raise AssertionError("fetched on a cache hit")
+
+    redis = FakeRedis()
+    main_module.get_redis = lambda: redis
+    monkeypatch.setattr(main_module, "parse", fail)
+    asyncio.run(cache.set_cached(redis, "http://x", "X", "desc", "2026-01-01T00:00:00"))
+    result = asyncio.run(route_endpoint("/parse")("http://X"))
+    assert result["cached"] is True and result["stale"] is False
+    assert (result["name"], result["description"]) == ("X", "desc")
+
+
+def test_parse_endpoint_refreshes_stale_cache_in_background():
+    from parser import cache
+
+    calls = []
+    redis = FakeRedis()
+    main_module.get_redis = lambda: redis
+    main_module.parse_and_save_task = types.SimpleNamespace(apply_async=lambda *a, **k: calls.append(k))
+    asyncio.run(cache.set_cached(redis, "http://x", "X", "desc", "2026-01-01T00:00:00"))
+    entry = json.loads(redis.data["page:http://x/"])
+    entry["cached_at"] -= cache.CACHE_TTL + 1
+    redis.data["page:http://x/"] = json.dumps(entry)
+
+    result = asyncio.run(route_endpoint("/parse")("http://x"))
+    assert result["stale"] is True and result["name"] == "X"
+    assert len(calls) == 1
+    assert calls[0]["queue"] == "parser.bulk"
+
+
+def test_parse_endpoint_charges_stale_refreshes_to_the_caller(monkeypatch):
+    from parser import admission, cache
+
+    redis = FakeRedis()
+    main_module.get_redis = lambda: redis
+    main_module.parse_and_save_task = types.SimpleNamespace(apply_async=lambda *a, **k: None)
+    monkeypatch.setattr(admission, "CLIENT_QUOTA", 100)
+    asyncio.run(cache.set_cached(redis, "http://x", "X", "desc", "2026-01-01T00:00:00"))
+    entry = json.loads(redis.data["page:http://x/"])
+    entry["cached_at"] -= cache.CACHE_TTL + 1
+    redis.data["page:http://x/"] = json.dumps(entry)
+
+    request = types.SimpleNamespace(headers={"X-Client-Id": "reports"}, client=None)
+    asyncio.run(route_endpoint("/parse")("http://x", request))
+    assert [key.split(":")[1] for key in redis.data if key.startswith("quota:")] == ["reports"]
+
+
+def test_crawl_endpoint_charges_max_pages_to_the_caller(monkeypatch):
+    from parser import admission
+
+    async def start_crawl(redis, seeds, max_depth, max_pages):
+        return "c1", len(seeds)
+
+    redis = FakeRedis()
+    main_module.get_redis = lambda: redis
+    monkeypatch.setattr(main_module, "start_crawl", start_crawl)
+    monkeypatch.setattr(main_module, "crawl_task", types.SimpleNamespace(apply_async=lambda *a, **k: None))
+    monkeypatch.setattr(admission, "CLIENT_QUOTA", 100)
+    request = types.SimpleNamespace(headers={"X-Client-Id": "reports"}, client=None)
+    data = main_module.CrawlRequest(seeds=["http://a.test/"], max_pages=60)
+    asyncio.run(main_module.crawl_endpoint(data, request))
+    with pytest.raises(admission.Rejected):
+        asyncio.run(main_module.crawl_endpoint(data, request))
+
+
+def test_parse_celery_routes_by_priority():
+    calls = []
+    main_module.get_redis = lambda: FakeRedis()
+    main_module.parse_and_save_task = types.SimpleNamespace(apply_async=lambda *a, **k: calls.append(k))
+    asyncio.run(main_module.parse_endpoint("http://x"))
+    asyncio.run(main_module.parse_endpoint("http://y", "bulk"))
+    assert [(c["queue"], c["priority"]) for c in calls] == [("parser.interactive", 0), ("parser.bulk", 6)]
+
+
+def test_parse_celery_rejects_when_queue_is_full(monkeypatch):
+    from parser import admission
+
+    redis = FakeRedis()
+    main_module.get_redis = lambda: redis
+    main_module.parse_and_save_task = types.SimpleNamespace(apply_async=lambda *a, **k: None)
+    monkeypatch.setattr(admission, "DEPTH_CACHE_TTL", 0)
+    monkeypatch.setitem(admission.MAX_QUEUE_DEPTH, "interactive", 10)
+    redis.data["parser.interactive"] = [0] * 8
+    redis.data["parser.interactive:6"] = [0] * 4
+    now = int(time.time())
+    for bucket in range(now - admission.THROUGHPUT_WINDOW, now):
+        redis.data[admission.throughput_key("parser.interactive", bucket)] = 1
+
+    with pytest.raises(admission.Rejected) as rejected:
+        asyncio.run(main_module.parse_endpoint("http://x"))
+    assert rejected.value.retry_after == 3
+    response = asyncio.run(main_module.rejected_handler(None, rejected.value))
+    assert response.status_code == 429 and response.headers["Retry-After"] == "3"
+
+    redis.data["parser.interactive"] = []
+    assert asyncio.run(main_module.parse_endpoint("http://x"))["message"] == "Task started"
+
+
+def test_client_quota_limits_urls_per_minute(monkeypatch):
+    from parser import admission
+
+    redis = FakeRedis()
+    monkeypatch.setattr(admission, "CLIENT_QUOTAS", {"crawler": 3})
+
+    async def run():
+        await admission.check_quota(redis, "crawler", 2)
+        await admission.check_quota(redis, "someone-else", 100)
+        with pytest.raises(admission.Rejected):
+            await admission.check_quota(redis, "crawler", 2)
+        await admission.check_quota(redis, "crawler", 1)
+
+    asyncio.run(run())
+
+
+def test_hash_ring_moves_few_domains_when_a_shard_is_added():
+    from parser import sharding
+
+    assert sharding.registrable_domain("www.shop.example.co.uk") == "example.co.uk"
+    assert sharding.registrable_domain("a.b.example.com") == "example.com"
+
+    domains = [f"site{i}.test" for i in range(2000)]
+    before, after = sharding.HashRing(8), sharding.HashRing(9)
+    moved = [d for d in domains if before.shard(d) != after.shard(d)]
+    assert {after.shard(d) for d in moved} == {8}
+    assert len(moved) < len(domains) / 5
+    assert len({before.shard(d) for d in domains}) == 8
+
+
+def test_sharded_batches_split_by_domain(monkeypatch):
+    from parser import admission, sharding
+
+    monkeypatch.setattr(sharding, "SHARDS", 4)
+    monkeypatch.setattr(sharding, "_ring", None)
+    monkeypatch.setattr(admission, "SHARD_QUEUES", [sharding.shard_queue(i) for i in range(4)])
+    monkeypatch.setattr(admission, "DEPTH_CACHE_TTL", 0)
+    calls = []
+    main_module.get_redis = lambda: FakeRedis()
+    main_module.parse_batch_task = types.SimpleNamespace(apply_async=lambda args, **k: calls.append((args[0], k)))
+
+    urls = [f"http://www.site{i}.test/{page}" for i in range(8) for page in ("a", "b")]
+    result = asyncio.run(main_module.parse_batch_celery_endpoint(main_module.ParseBatchRequest(urls=urls)))
+    assert sorted(url for batch, _ in calls for url in batch) == sorted(urls)
+    assert result["task_ids"] == [k["task_id"] for _, k in calls]
+    for batch, k in calls:
+        assert {sharding.queue_for_url(url) for url in batch} == {k["queue"]}
+        assert k["priority"] == 6
+    assert sharding.queue_for_url("http://site1.test/") == sharding.queue_for_url("https://www.site1.test/x")
+
+    assert admission.depth_keys("bulk") == ["parser.0:6", "parser.1:6", "parser.2:6", "parser.3:6"]
+    assert admission.completed_queue({"routing_key": "parser.2", "priority": 0}) == "parser.interactive"
+
+
+def test_extract_links_in_the_same_pass():
+    html = ("<html><head><title>T</title><base href='/docs/'></head>"
+            "<body><a href='a.html'>A</a><a>none</a><a href='/b'>B</a></body></html>")
+    page = extract_module.extract_page(html, "http://a.test/", links=True)
+    assert page[:2] == ("T", "No description")
+    assert page.links == ["/docs/a.html", "/b"]
+    assert "links" not in page.fields and "base" not in page.fields
+
+
+def test_crawl_push_dedupes_and_caps_pages():
+    fakeredis = pytest.importorskip("fakeredis")
+    from parser import crawl
+
+    async def run():
+        redis = fakeredis.FakeAsyncRedis(decode_responses=True)
+        crawl_id, queued = await crawl.start_crawl(redis, ["http://a.test", "http://a.test/"], 1, 2)
+        again = await crawl.push(redis, crawl_id, ["http://a.test/", "http://a.test/x", "http://a.test/y"], 1)
+        meta = await crawl.crawl_meta(redis, crawl_id)
+        return queued, again, meta["queued"], meta["frontier"]
+
+    assert asyncio.run(run()) == (1, 1, 2, 2)
+
+
+def test_parse_sitemap():
+    index = b"<sitemapindex xmlns='http://www.sitemaps.org/schemas/sitemap/0.9'><sitemap><loc>http://a.test/s.xml</loc></sitemap></sitemapindex>"
+    urlset = b"<urlset xmlns='http://www.sitemaps.org/schemas/sitemap/0.9'><url><loc> http://a.test/p </loc></url></urlset>"
+    from parser import crawl
+    assert crawl.parse_sitemap(index) == ([], ["http://a.test/s.xml"])
+    assert crawl.parse_sitemap(urlset) == (["http://a.test/p"], [])
+
+
+def test_crawl_follows_same_site_links_to_max_depth(monkeypatch):
+    fakeredis = pytest.importorskip("fakeredis")
+    from parser import crawl
+
+    pages = {
+        "http://a.test/": "<html><head><title>A</title></head><body>"
+                          "<a href='/b'>b</a><a href='http://other.test/x'>x</a>"
+                          "<a href='mailto:me@a.test'>m</a><a href='#top'>top</a></body></html>",
+        "http://a.test/b": "<html><head><title>B</title></head><body><a href='/c'>c</a></body></html>",
+    }
+    redis = fakeredis.FakeAsyncRedis(decode_responses=True)
+    client = FakeClientSession(pages)
+    written = []
+
+    async def recording_write_pages(batch, touched):
+        written.extend(batch)
+
+    monkeypatch.setattr(tasks_module, "get_http_session", lambda: client)
+    monkeypatch.setattr(tasks_module, "get_host_limiter", lambda: None)
+    monkeypatch.setattr(tasks_module, "get_robots", lambda: None)
+    monkeypatch.setattr(tasks_module, "get_redis", lambda: redis)
+    monkeypatch.setattr(tasks_module, "get_async_session", fake_get_session)
+    monkeypatch.setattr(writer_module, "write_pages", recording_write_pages)
+
+    async def run():
+        crawl_id, _ = await crawl.start_crawl(redis, ["http://a.test"], 1, 100)
+        while await tasks_module.crawl_batch(crawl_id):
+            pass
+        return await crawl.crawl_meta(redis, crawl_id)
+
+    meta = asyncio.run(run())
+    assert (meta["parsed"], meta["failed"], meta["frontier"]) == (2, 0, 0)
+    assert [url for url, _ in client.requested] == ["http://a.test/", "http://a.test/b"]
+    assert sorted(page.name for page in written) == ["A", "B"]
+
+
+def test_crawl_normalizes_sitemap_pages_and_keeps_them_on_site(monkeypatch):
+    fakeredis = pytest.importorskip("fakeredis")
+    from parser import crawl
+
+    sitemap = ("<urlset xmlns='http://www.sitemaps.org/schemas/sitemap/0.9'>"
+               "<url><loc>HTTP://A.test/p</loc></url><url><loc>http://other.test/x</loc></url></urlset>")
+    pages = {
+        "http://a.test/sitemap.xml": sitemap,
+        "http://a.test/p": "<html><head><title>P</title></head><body><a href='/p'>p</a></body></html>",
+    }
+    redis = fakeredis.FakeAsyncRedis(decode_responses=True)
+    client = FakeClientSession(pages)
+
+    async def recording_write_pages(batch, touched):
+        pass
+
+    monkeypatch.setattr(tasks_module, "get_http_session", lambda: client)
+    monkeypatch.setattr(tasks_module, "get_host_limiter", lambda: None)
+    monkeypatch.setattr(tasks_module, "get_robots", lambda: None)
+    monkeypatch.setattr(tasks_module, "get_redis", lambda: redis)
+    monkeypatch.setattr(tasks_module, "get_async_session", fake_get_session)
+    monkeypatch.setattr(writer_module, "write_pages", recording_write_pages)
+
+    async def run():
+        crawl_id, _ = await crawl.start_crawl(redis, ["http://a.test/sitemap.xml"], 1, 100)
+        while await tasks_module.crawl_batch(crawl_id):
+            pass
+        return await crawl.crawl_meta(redis, crawl_id)
+
+    meta = asyncio.run(run())
+    assert [url for url, _ in client.requested] == ["http://a.test/sitemap.xml", "http://a.test/p"]
+    assert (meta["parsed"], meta["failed"]) == (1, 0)
+
+
+def test_snapshot_store_is_content_addressed(tmp_path, monkeypatch):
+    pytest.importorskip("zstandard")
+    from parser import snapshots
+
+    store = snapshots.LocalSnapshotStore(str(tmp_path))
+    monkeypatch.setattr(tasks_module, "get_snapshot_store", lambda: store)
+    html = "<html><head><title>Snap</title></head><body>" + "x" * 1000 + "</body></html>"
+    log = run_parse_and_capture(html)
+    content_hash = log.written[0].snapshot_hash
+    assert content_hash == log.written[0].content_hash
+    assert store.get(content_hash) == (html.encode(), "utf-8")
+
+    run_parse_and_capture(html)
+    assert len(list(tmp_path.rglob("*.zst"))) == 1
+
+
+def test_snapshot_holds_the_whole_page_when_streaming_the_head(tmp_path, monkeypatch):
+    pytest.importorskip("zstandard")
+    from parser import snapshots
+
+    store = snapshots.LocalSnapshotStore(str(tmp_path))
+    monkeypatch.setattr(tasks_module, "get_snapshot_store", lambda: store)
+    monkeypatch.setattr(tasks_module, "STREAM_HEAD", True)
+    html = "<html><head><title>Snap</title></head><body>" + "x" * 100000 + "</body></html>"
+    log = run_parse_and_capture(html)
+    assert store.get(log.written[0].snapshot_hash) == (html.encode(), "utf-8")
+
+
+def test_reextract_rebuilds_pages_from_snapshots(tmp_path, monkeypatch):
+    pytest.importorskip("zstandard")
+    from parser import reextract, snapshots
+    from parser.connection import get_session, init_db
+    from parser.models import Page
+    from sqlmodel import select
+
+    monkeypatch.setenv("PARSER_SNAPSHOT_DIR", str(tmp_path))
+    store = snapshots.LocalSnapshotStore(str(tmp_path))
+    store.put("h1", "<title>Fresh</title><meta name='description' content='New'>".encode("cp1251"), "cp1251")
+    init_db()
+    with get_session() as session:
+        session.add(Page(url="http://re.test/a", name="Old", snapshot_hash="h1"))
+        session.add(Page(url="http://re.test/b", name="Old", snapshot_hash="h1"))
+        session.add(Page(url="http://re.test/c", name="Old", snapshot_hash="gone"))
+        session.commit()
+
+    assert reextract.reextract(workers=1) == {"updated": 2, "missing": 1}
+    with get_session() as session:
+        names = {p.url: (p.name, p.description) for p in session.exec(select(Page)).all()}
+    assert names["http://re.test/a"] == ("Fresh", "New")
+    assert names["http://re.test/c"] == ("Old", None)
+
+
+class SequenceClientSession:
+    def __init__(self, responses):
+        self.responses = list(responses)
+        self.calls = 0
+
+    def get(self, url, headers=None):
+        self.calls += 1
+        response = self.responses.pop(0)
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+
+def test_fetch_retries_retryable_failures(monkeypatch):
+    from parser.breaker import CircuitBreaker
+
+    monkeypatch.setattr(tasks_module, "backoff", lambda attempt: 0)
+    monkeypatch.setattr(tasks_module, "get_host_limiter", lambda: None)
+    monkeypatch.setattr(tasks_module, "get_robots", lambda: None)
+    monkeypatch.setattr(tasks_module, "breaker", CircuitBreaker())
+    session = SequenceClientSession([
+        asyncio.TimeoutError(),
+        FakeRespCtx("", status=503),
+        FakeRespCtx("<title>ok</title>"),
+    ])
+    fetched = asyncio.run(tasks_module.fetch_with_retry(session, "http://a.test/"))
+    assert session.calls == 3
+    assert fetched.status == 200
+
+
+def test_circuit_breaker_fast_fails_after_repeated_failures(monkeypatch):
+    from parser.breaker import CircuitBreaker, CircuitOpenError
+
+    monkeypatch.setattr(tasks_module, "backoff", lambda attempt: 0)
+    monkeypatch.setattr(tasks_module, "get_host_limiter", lambda: None)
+    monkeypatch.setattr(tasks_module, "get_robots", lambda: None)
+    monkeypatch.setattr(tasks_module, "breaker", CircuitBreaker(failures=2, reset_timeout=60))
+    session = SequenceClientSession([aiohttp.ClientConnectionError()] * 100)
+
+    async def run():
+        for _ in range(2):
+            with pytest.raises(aiohttp.ClientConnectionError):
+                await tasks_module.fetch_with_retry(session, "http://down.test/")
+        calls = session.calls
+        with pytest.raises(CircuitOpenError):
+            await tasks_module.fetch_with_retry(session, "http://down.test/")
+        return calls
+
+    calls = asyncio.run(run())
+    assert session.calls == calls == 2 * (tasks_module.HTTP_RETRIES + 1)
+
+
+def test_metrics_endpoint_exposes_stage_timings():
+    run_parse_and_capture("<html><head><title>M</title></head></html>")
+    response = main_module.metrics_endpoint()
+    body = response.body.decode()
+    assert 'parser_stage_seconds_count{stage="extract"}' in body
+    assert 'parser_stage_seconds_count{stage="download"}' in body
+    assert "parser_fetched_bytes_total" in body
+    assert 'parser_pages_total{outcome="changed"}' in body
+
+
+def test_workers_serve_metrics_only_when_a_port_is_set(monkeypatch):
+    from parser import metrics
+
+    started = []
+    monkeypatch.setattr(metrics, "start_http_server", lambda port, registry: started.append((port, registry)))
+    metrics.start_metrics_server(0)
+    metrics.start_metrics_server(9100)
+    assert started == [(9100, metrics.REGISTRY)]